@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+'''Convert the maps in the data directory to binary level files.
+
+Each map.json is written next to itself as map.lvl, which is what the game
+loads. Run this again after editing a map. With no arguments the maps of
+every level in the game are converted.
+
+With --streamed, the maps (JSON or Tiled .tmx) are written as streamed
+levels, map.lvs, which are loaded a chunk at a time around the camera.
+This is meant for levels too large to load whole.
+'''
+
+import optparse
+import os
+
+from gamelib import data
+from gamelib import levelfile
+from gamelib import sim
+from gamelib import streaming
+from gamelib import tmx
+
+parser = optparse.OptionParser(usage='%prog [options] [map ...]')
+parser.add_option('--streamed', action='store_true', default=False,
+                  help='write streamed levels (.lvs) instead')
+parser.add_option('--chunk-size', type='int', default=streaming.CHUNK_SIZE,
+                  help='tiles per side of a streamed chunk [default: %default]')
+options, sources = parser.parse_args()
+
+sources = sources or [data.filepath(os.path.splitext(world)[0] + '.json')
+                      for world in sim.WORLDS]
+
+for source in sources:
+    if options.streamed:
+        if source.endswith(tmx.EXTENSION):
+            world = tmx.parse(source)
+        else:
+            world = levelfile.json.load(open(source))
+
+        destination = os.path.splitext(source)[0] + streaming.EXTENSION
+        streaming.convert(world, destination, options.chunk_size)
+    else:
+        destination = levelfile.level_filename(source)
+        levelfile.convert(source, destination)
+
+    print('%s -> %s (%d bytes)' % (source, destination, os.path.getsize(destination)))
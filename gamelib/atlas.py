@@ -0,0 +1,89 @@
+'''Texture atlas shared by the game's sprites.
+
+Sprite images are packed into a few large textures so that the map, goo,
+player and HUD can be drawn without switching textures between them.
+'''
+
+import pyglet
+from pyglet.image.atlas import AllocatorException, TextureAtlas
+import data
+
+ATLAS_SIZE = 1024
+
+# Transparent pixels left around each image, so filtering a scaled or
+# rotated sprite never samples its neighbours in the atlas
+GUTTER = 1
+
+atlases = []
+regions = {}
+
+class GutteredAtlas(TextureAtlas):
+    '''A TextureAtlas that keeps GUTTER pixels clear around each image.
+    '''
+    def add(self, img):
+        x, y = self.allocator.alloc(img.width + 2 * GUTTER, img.height + 2 * GUTTER)
+        self.texture.blit_into(img, x + GUTTER, y + GUTTER, 0)
+        return self.texture.get_region(x + GUTTER, y + GUTTER, img.width, img.height)
+
+def build(filenames, grids=()):
+    '''Pack the named images from the data directory into the atlas.
+
+    "grids" are the (filename, rows, columns) of sprite sheets whose frames
+    are packed one by one, see grid(). Images are packed tallest first,
+    which wastes the least space with the row allocator pyglet uses.
+    '''
+    images = [(filename, pyglet.image.load(data.filepath(filename)))
+              for filename in filenames if filename not in regions]
+    for filename, rows, columns in grids:
+        images.extend(grid_frames(filename, rows, columns))
+    images.sort(key=lambda item: item[1].height, reverse=True)
+
+    for key, image in images:
+        add(key, image)
+
+def grid_frames(filename, rows, columns):
+    '''The (key, image) of each frame of a sprite sheet not packed yet.
+    '''
+    sheet = pyglet.image.ImageGrid(pyglet.image.load(data.filepath(filename)), rows, columns)
+    return [((filename, rows, columns, index), frame)
+            for index, frame in enumerate(sheet)
+            if (filename, rows, columns, index) not in regions]
+
+def add(key, image):
+    '''Pack "image" into the first atlas with room, making one if none has.
+    '''
+    for texture_atlas in atlases:
+        try:
+            regions[key] = texture_atlas.add(image)
+            return regions[key]
+        except AllocatorException:
+            pass
+
+    texture_atlas = GutteredAtlas(ATLAS_SIZE, ATLAS_SIZE)
+    atlases.append(texture_atlas)
+
+    regions[key] = texture_atlas.add(image)
+    return regions[key]
+
+def image(filename):
+    '''Return the atlas region for an image in the data directory.
+
+    Images that were not part of build() are packed on first use.
+    '''
+    if filename not in regions:
+        return add(filename, pyglet.image.load(data.filepath(filename)))
+
+    return regions[filename]
+
+def grid(filename, rows, columns):
+    '''Return the atlas regions of the frames of a sprite sheet, in the
+    order of an ImageGrid.
+
+    Each frame is packed on its own with a gutter, so a rotated frame does
+    not pick up the edges of the frames next to it in the sheet.
+    '''
+    if (filename, rows, columns, 0) not in regions:
+        for key, frame in grid_frames(filename, rows, columns):
+            add(key, frame)
+
+    return [regions[(filename, rows, columns, index)] for index in range(rows * columns)]
@@ -0,0 +1,192 @@
+'''Gameplay benchmark run on the headless simulation.
+
+Each level is played for a number of ticks, either by a fixed script or
+from a recording, and the time of every simulation step is measured.
+Results are written as JSON so a build can be compared with a baseline.
+'''
+
+import gc
+import math
+import timeit
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import replay
+import sim
+
+TICKS = 3600
+
+clock = timeit.default_timer
+
+def percentile(ordered, fraction):
+    index = min(int(len(ordered) * fraction), len(ordered) - 1)
+    return ordered[index]
+
+def shoot_at(simulation, dx, dy):
+    '''Aim "dx", "dy" pixels from the player and shoot.
+    '''
+    screen_x, screen_y = simulation.player.screen_position()
+    simulation.input.mouse_position = (int(screen_x + dx), int(screen_y + dy))
+    simulation.shoot(*simulation.input.mouse_position)
+
+def wander(simulation):
+    '''Walk back and forth, shooting all around.
+    '''
+    tick = simulation.tick
+    phase = (tick // 120) % 4
+    simulation.input.left = phase == 3
+    simulation.input.right = phase != 3
+
+    if tick % 20 == 0:
+        angle = tick * 0.37
+        shoot_at(simulation, math.cos(angle) * 200, math.sin(angle) * 200)
+
+def scripted_input(simulation):
+    '''Wander, restarting on death.
+
+    Reaching the princess starts the same level again.
+    '''
+    if simulation.player.finished:
+        simulation.start_level()
+
+    simulation.input.space = simulation.player.dead
+    wander(simulation)
+
+def collision_queries(simulation):
+    return simulation.tile_map.queries + simulation.player.goo_pool.splat_hash.queries
+
+def run(simulation, ticks, drive, step=sim.STEP):
+    '''Step "simulation" "ticks" times, calling drive() before each step.
+
+    Besides times and collision queries, the net number of container
+    objects (lists, tuples, dicts, instances) each step leaves behind is
+    counted. Objects created and freed within a step, and floats and other
+    non-containers, do not show up in it, so it finds leaks and growing
+    caches rather than allocation churn.
+    '''
+    times = []
+    queries = 0
+    containers = 0
+
+    last_level = None
+    last_queries = 0
+
+    # With the collector off, the gen 0 count goes up for every container
+    # object created and down for every one freed
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        for i in range(ticks):
+            drive(simulation)
+
+            level = (simulation.tile_map, simulation.player)
+            if level != last_level:
+                last_level = level
+                last_queries = collision_queries(simulation)
+
+            count = gc.get_count()[0]
+            start = clock()
+
+            simulation.step(step)
+
+            times.append(clock() - start)
+            containers += gc.get_count()[0] - count
+
+            if (simulation.tile_map, simulation.player) == last_level:
+                current = collision_queries(simulation)
+                queries += current - last_queries
+                last_queries = current
+
+            del simulation.events[:]
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    ordered = sorted(times)
+    total = sum(times)
+
+    return {
+        'ticks': ticks,
+        'update_ms': {
+            'mean': total / ticks * 1000,
+            'p50': percentile(ordered, 0.5) * 1000,
+            'p90': percentile(ordered, 0.9) * 1000,
+            'p99': percentile(ordered, 0.99) * 1000,
+            'max': ordered[-1] * 1000,
+        },
+        'ticks_per_second': ticks / max(total, 1e-9),
+        'collision_queries_per_tick': queries / float(ticks),
+        'net_containers_per_tick': containers / float(ticks),
+    }
+
+def limit(ticks, recording):
+    '''Ticks to play "recording" for: all of it, or at most "ticks" if given.
+    '''
+    if ticks is None:
+        return recording.ticks
+
+    return min(ticks, recording.ticks)
+
+def bench_world(world, ticks, recording=None):
+    if recording is not None:
+        simulation = recording.simulation()
+        drive = recording.apply
+        step = recording.step
+    else:
+        simulation = sim.Simulation([world], seed=0)
+        drive = scripted_input
+        step = sim.STEP
+
+    simulation.start_level()
+    del simulation.events[:]
+
+    return run(simulation, ticks, drive, step)
+
+def report(results, baseline=None):
+    for world in sorted(results['worlds']):
+        result = results['worlds'][world]
+        update = result['update_ms']
+
+        line = '%-14s p50 %.3fms  p90 %.3fms  p99 %.3fms  max %.3fms  %.1f queries  %+.1f containers' % (
+            world, update['p50'], update['p90'], update['p99'], update['max'],
+            result['collision_queries_per_tick'], result['net_containers_per_tick'])
+
+        if baseline is not None and world in baseline['worlds']:
+            before = baseline['worlds'][world]['update_ms']
+            line += '  p50 %+.1f%%  p99 %+.1f%%' % (
+                (update['p50'] / before['p50'] - 1) * 100,
+                (update['p99'] / before['p99'] - 1) * 100)
+
+        print(line)
+
+def main(worlds, ticks=None, output=None, baseline=None, recording=None):
+    '''Benchmark each of "worlds" and optionally save the results as JSON.
+
+    With a "recording" the replayed session is benchmarked instead, and
+    "worlds" is ignored. It is played to its end unless "ticks" is given.
+    '''
+    step = sim.STEP
+    if recording is not None:
+        recording = replay.Replay(recording)
+        worlds = [recording.worlds[recording.world_index]]
+        ticks = limit(ticks, recording)
+        step = recording.step
+    elif ticks is None:
+        ticks = TICKS
+
+    results = {'ticks': ticks, 'step': step, 'worlds': {}}
+    for world in worlds:
+        results['worlds'][world] = bench_world(world, ticks, recording)
+
+    if baseline is not None:
+        baseline = json.load(open(baseline))
+
+    report(results, baseline)
+
+    if output is not None:
+        json.dump(results, open(output, 'w'), indent=2, sort_keys=True)
+
+    return 0
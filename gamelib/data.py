@@ -2,14 +2,25 @@
 
 Loads data files from the "data" directory shipped with a game.
 
-Enhancing this to handle caching etc. is left as an exercise for the reader.
+Decoded images, frame grids, sounds and parsed JSON are kept in a shared
+cache keyed by filename and decode options, so each file is only read and
+decoded once while it stays in the cache.
 '''
 
 import os
+import struct
+import wave
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 data_py = os.path.abspath(os.path.dirname(__file__))
 data_dir = os.path.normpath(os.path.join(data_py, '..', 'data'))
 
+# Decoded copies of the music are kept here between runs
+music_dir = os.path.join(os.path.expanduser('~'), '.blank_page', 'music')
+
 def filepath(filename):
     '''Determine the path to a file in the data directory.
     '''
@@ -22,3 +33,246 @@ def load(filename, mode='rb'):
     '''
     return open(os.path.join(data_dir, filename), mode)
 
+def write_atomic(path, write):
+    '''Call write() with a file opened for writing, then move it to "path".
+
+    The file is written under another name first, so a failed or cut short
+    write never leaves a broken file at "path" to be loaded by later runs.
+    Errors from write() are raised once the partial file is removed.
+    '''
+    partial = path + '.part'
+    try:
+        output = open(partial, 'wb')
+        try:
+            write(output)
+        finally:
+            output.close()
+
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(partial, path)
+    except:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+def image_size(filename):
+    '''Read the (width, height) of a PNG or GIF without decoding it.
+    '''
+    f = load(filename)
+    try:
+        header = f.read(24)
+    finally:
+        f.close()
+
+    if header.startswith(b'\x89PNG'):
+        return struct.unpack('>II', header[16:24])
+    if header.startswith(b'GIF'):
+        return struct.unpack('<HH', header[6:10])
+
+    raise ValueError('unknown image format: %s' % filename)
+
+class CacheEntry(object):
+    def __init__(self, value, size):
+        self.value = value
+        self.size = size
+        self.refs = 0
+        self.last_used = 0
+
+class Cache(object):
+    '''Loaded assets with refcounts and a memory budget.
+
+    Entries that are referenced are never evicted. Once the estimated size
+    of all entries goes over "budget" bytes, unreferenced entries are
+    dropped least recently used first.
+    '''
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.budget = budget
+        self.entries = {}
+        self.keys = {}
+        self.size = 0
+        self.clock = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader, acquire=False):
+        '''Return the cached value for "key", calling loader() on a miss.
+
+        loader() returns a (value, estimated size in bytes) tuple. With
+        "acquire" the entry is referenced until release() is called.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+
+            value, size = loader()
+            entry = self.entries[key] = CacheEntry(value, size)
+            self.keys[id(value)] = key
+            self.size += size
+        else:
+            self.hits += 1
+
+        self.clock += 1
+        entry.last_used = self.clock
+
+        if acquire:
+            entry.refs += 1
+
+        self.evict(key)
+
+        return entry.value
+
+    def release(self, value):
+        '''Drop a reference taken with get(..., acquire=True).
+        '''
+        key = self.keys.get(id(value))
+        if key is None:
+            return
+
+        entry = self.entries[key]
+        entry.refs = max(entry.refs - 1, 0)
+
+        self.evict()
+
+    def evict(self, keep=None):
+        if self.size <= self.budget:
+            return
+
+        # Dropping an entry with no size frees nothing, so those are kept
+        unused = [(entry.last_used, key) for key, entry in self.entries.items()
+                  if entry.refs == 0 and entry.size > 0 and key != keep]
+        unused.sort()
+
+        for last_used, key in unused:
+            if self.size <= self.budget:
+                break
+
+            self.remove(key)
+            self.evictions += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        del self.keys[id(entry.value)]
+        self.size -= entry.size
+
+    def clear(self):
+        for key in list(self.entries):
+            self.remove(key)
+
+cache = Cache()
+
+def release(value):
+    '''Release a value loaded with acquire=True.
+    '''
+    cache.release(value)
+
+def image(filename, atlas=False, acquire=False):
+    '''Load an image from the data directory.
+
+    With "atlas" the image is packed into the shared sprite atlas and the
+    atlas region is returned.
+    '''
+    def loader():
+        if atlas:
+            import atlas as sprite_atlas
+            # The atlas owns the texture memory
+            return sprite_atlas.image(filename), 0
+
+        import pyglet
+        value = pyglet.image.load(filepath(filename))
+        return value, value.width * value.height * 4
+
+    return cache.get(('image', filename, atlas), loader, acquire)
+
+def grid(filename, rows, columns, atlas=False, centre=False, acquire=False):
+    '''Split an image from the data directory into a grid of frames.
+
+    With "centre" every frame is anchored on its centre.
+    '''
+    def loader():
+        if atlas:
+            import atlas as sprite_atlas
+            value = sprite_atlas.grid(filename, rows, columns)
+        else:
+            import pyglet
+            value = pyglet.image.ImageGrid(image(filename), rows, columns)
+
+        if centre:
+            for frame in value:
+                frame.anchor_x = frame.width / 2
+                frame.anchor_y = frame.height / 2
+
+        return value, 0
+
+    return cache.get(('grid', filename, rows, columns, atlas, centre), loader, acquire)
+
+def decoded_size(source):
+    audio_format = source.audio_format
+    return int(source.duration * audio_format.sample_rate *
+               audio_format.channels * audio_format.sample_size / 8)
+
+def sound(filename, acquire=False):
+    '''Load and fully decode a sound from the data directory.
+    '''
+    def loader():
+        import pyglet
+        value = pyglet.media.load(filepath(filename), streaming=False)
+        return value, decoded_size(value)
+
+    return cache.get(('sound', filename), loader, acquire)
+
+def write_wav(f, source):
+    '''Save the PCM of a decoded (static) source to file "f" as WAV.
+    '''
+    audio_format = source.audio_format
+
+    output = wave.open(f, 'wb')
+    try:
+        output.setnchannels(audio_format.channels)
+        output.setsampwidth(audio_format.sample_size // 8)
+        output.setframerate(audio_format.sample_rate)
+        output.writeframes(source._data)
+    finally:
+        output.close()
+
+def music(filename, acquire=False):
+    '''Load a music track from the data directory decoded to PCM.
+
+    The decoded track is also saved as a WAV file in "music_dir", which
+    later runs load instead of decoding the original again.
+    '''
+    def loader():
+        import pyglet
+
+        path = filepath(filename)
+        cached = os.path.join(music_dir, filename + '.wav')
+
+        if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+            value = pyglet.media.load(cached, streaming=False)
+        else:
+            value = pyglet.media.load(path, streaming=False)
+
+            try:
+                if not os.path.isdir(music_dir):
+                    os.makedirs(music_dir)
+                write_atomic(cached, lambda output: write_wav(output, value))
+            except (IOError, OSError, AttributeError, wave.Error):
+                # Still decoded, only not kept for next time
+                pass
+
+        return value, decoded_size(value)
+
+    return cache.get(('music', filename), loader, acquire)
+
+def load_json(filename, acquire=False):
+    '''Load and parse a JSON file from the data directory.
+
+    The parsed value is shared between callers and must not be modified.
+    '''
+    def loader():
+        text = load(filename).read()
+        return json.loads(text), len(text) * 4
+
+    return cache.get(('json', filename), loader, acquire)
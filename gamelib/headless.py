@@ -0,0 +1,50 @@
+'''Commands that run the game simulation without a window or sound.
+'''
+
+import time
+
+import bench
+import playtest
+import replay
+import sim
+
+def describe(simulation):
+    if simulation.complete:
+        return 'completed every level'
+
+    level = simulation.worlds[simulation.world_index]
+    if simulation.player.dead:
+        return 'dead on %s' % level
+    if simulation.player.finished:
+        return 'reached the princess on %s' % level
+    return 'playing %s' % level
+
+def play_replay(filename):
+    recording = replay.Replay(filename)
+
+    start = time.time()
+    simulation = replay.play(recording)
+    elapsed = time.time() - start
+
+    print('%d ticks in %.3fs (%.0f ticks/s), %s' % (
+        simulation.tick, elapsed, simulation.tick / max(elapsed, 1e-9), describe(simulation)))
+
+    return 0
+
+def main(options, args):
+    if options.playtest:
+        worlds = [arg for arg in args if not arg.endswith(replay.EXTENSION)]
+        recordings = [arg for arg in args if arg.endswith(replay.EXTENSION)]
+        if not args:
+            worlds = sim.WORLDS
+
+        return playtest.main(worlds, recordings, options.ticks, options.processes)
+
+    if options.bench:
+        return bench.main(args or sim.WORLDS, options.ticks, options.output,
+                          options.baseline, options.replay)
+
+    if options.replay:
+        return play_replay(options.replay)
+
+    return 0
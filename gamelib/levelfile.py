@@ -0,0 +1,133 @@
+'''Compact binary levels, converted from the JSON maps.
+
+A level file is a fixed header followed by the music filename and one
+signed byte per tile, row 0 first, so loading one is a header unpack and a
+single copy of the tiles out of a memory map. The file is little endian:
+
+    header  "BPLV", version (B), width (H), height (H), max_goo (H),
+            spawn tile x, y (hh), goal tile x, y (hh), music length (B)
+    music   the music filename, utf-8
+    tiles   width * height tiles (b)
+
+The spawn is the tile the player starts on top of. The goal is the first
+princess tile, or -1, -1 for a level without one.
+'''
+
+from array import array
+import mmap
+import os
+import struct
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import data
+from tilemap import TILE_PLAYER, TILE_PRINCESS
+
+MAGIC = b'BPLV'
+VERSION = 1
+
+EXTENSION = '.lvl'
+
+HEADER = struct.Struct('<4sBHHHhhhhB')
+
+def spawn_tile(tiles, width):
+    '''The (x, y) of the last player tile, or (1, 0) if there is none.
+    '''
+    spawn = (1, 0)
+    for index, value in enumerate(tiles):
+        if value == TILE_PLAYER:
+            spawn = (index % width, index // width)
+
+    return spawn
+
+def goal_tile(tiles, width):
+    for index, value in enumerate(tiles):
+        if value == TILE_PRINCESS:
+            return (index % width, index // width)
+
+    return (-1, -1)
+
+def pack(world):
+    '''Return the level file contents for a world loaded from JSON.
+    '''
+    width = world['width']
+    tiles = array('b', world['tiles'])
+
+    if len(tiles) % width:
+        raise ValueError('%d tiles do not make rows of %d' % (len(tiles), width))
+
+    music = world['music'].encode('utf-8')
+    spawn_x, spawn_y = spawn_tile(tiles, width)
+    goal_x, goal_y = goal_tile(tiles, width)
+
+    header = HEADER.pack(MAGIC, VERSION, width, len(tiles) // width, world['max_goo'],
+                         spawn_x, spawn_y, goal_x, goal_y, len(music))
+
+    return header + music + tiles.tostring()
+
+def convert(source, destination):
+    '''Convert the JSON map at path "source" to a level file.
+    '''
+    world = json.load(open(source))
+    write(destination, world)
+
+def write(destination, world):
+    '''Write the level file for "world" to path "destination".
+    '''
+    data.write_atomic(destination, lambda output: output.write(pack(world)))
+
+def unpack(contents, filename=''):
+    '''Return a world dict from level file "contents".
+
+    It has the keys of a JSON map, with the tiles as an array, plus
+    "height", "spawn" and "goal".
+    '''
+    (magic, version, width, height, max_goo,
+     spawn_x, spawn_y, goal_x, goal_y, music_length) = HEADER.unpack_from(contents)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('%s is not a level this version can load' % filename)
+
+    offset = HEADER.size
+    music = contents[offset:offset + music_length].decode('utf-8')
+    offset += music_length
+
+    return {
+        'width': width,
+        'height': height,
+        'max_goo': max_goo,
+        'music': music,
+        'spawn': (spawn_x, spawn_y),
+        'goal': (goal_x, goal_y),
+        'tiles': array('b', contents[offset:offset + width * height]),
+    }
+
+def read(filename):
+    '''Memory map a level file from the data directory and unpack it.
+    '''
+    level_file = data.load(filename)
+    try:
+        contents = mmap.mmap(level_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return unpack(contents, filename)
+        finally:
+            contents.close()
+    finally:
+        level_file.close()
+
+def load(filename, acquire=False):
+    '''Load a level file from the data directory through the data cache.
+
+    Like data.load_json(), the world is shared and must not be modified.
+    '''
+    def loader():
+        world = read(filename)
+        return world, len(world['tiles']) + 256
+
+    return data.cache.get(('level', filename), loader, acquire)
+
+def level_filename(filename):
+    '''The level file name for a JSON map name.
+    '''
+    return os.path.splitext(filename)[0] + EXTENSION
@@ -1,17 +1,42 @@
-from collections import defaultdict
-import math
-import random
-try:
-    import json
-except ImportError:
-    import simplejson as json
+from collections import deque
+from ctypes import byref
+import sys
+import timeit
 
 from pyglet.gl import *
 from pyglet.sprite import Sprite
 from pyglet.window import mouse
 from pyglet.window import key
 import pyglet
+import atlas
 import data
+import replay
+import sim
+import sound
+from sim import interpolate
+from tilemap import TILE_SIZE
+
+clock = timeit.default_timer
+
+# (phase, seconds) in the order startup went through them
+startup_phases = []
+phase_started = clock()
+
+# Print each startup phase as it ends
+log_startup = False
+
+def print_phase(name, seconds):
+    sys.stderr.write('startup: %-12s %7.1fms\n' % (name, seconds * 1000))
+
+def end_phase(name):
+    global phase_started
+
+    now = clock()
+    startup_phases.append((name, now - phase_started))
+    phase_started = now
+
+    if log_startup:
+        print_phase(*startup_phases[-1])
 
 # OpenAL and ALSA don't like my system - put them last
 #pyglet.options['audio'] = ('directsound', 'silent', 'alsa', 'openal')
@@ -19,568 +44,729 @@ import data
 window = pyglet.window.Window(800, 600)
 window.set_caption('Blank Page')
 
-pyglet.resource.path.append(data.filepath(''))
-pyglet.resource.reindex()
+end_phase('window')
 
-crosshair_image = pyglet.image.load(data.filepath('crosshair.png'))
-crosshair = pyglet.window.ImageMouseCursor(crosshair_image, crosshair_image.width / 2, crosshair_image.height / 2)
+# Everything below is loaded by load_assets(), a piece per frame while the
+# intro plays, or all at once when the game starts first
+crosshair = None
+tileset = None
+background_image = None
+sounds = None
+text_overlay = None
+bar_outline = bar_fill_image = None
 
-GRAVITY = -300
+def load_crosshair():
+    global crosshair
 
-TILE_SIZE = 48
+    crosshair_image = pyglet.image.load(data.filepath('crosshair.png'))
+    crosshair = pyglet.window.ImageMouseCursor(crosshair_image, crosshair_image.width / 2, crosshair_image.height / 2)
 
-tileset = [None,
-           pyglet.resource.image('tile1.png'),
-           pyglet.resource.image('tile2.png'),
-           pyglet.resource.image('princess.png')]
+def load_sprites():
+    global tileset
 
-TILE_PLAYER = -1
-TILE_PRINCESS = 3
-TILE_LAVA = 2
+    atlas.build(['tile1.png', 'tile2.png', 'princess.png', 'splat.png',
+                 'bar_fill.gif', 'bar_outline.png'],
+                [('player.png', 5, 2), ('goo.png', 1, 4)])
 
-worlds = ['map1.json',
-          'map2.json',
-          'map3.json']
+    tileset = [None,
+               data.image('tile1.png', atlas=True, acquire=True),
+               data.image('tile2.png', atlas=True, acquire=True),
+               data.image('princess.png', atlas=True, acquire=True)]
 
-world_index = 0
-world_offset = [0, 0]
-world = None
-world_map = None
+def load_background():
+    global background_image
 
-map_width = None
-map_height = None
-map_batch = None
+    background_image = pyglet.image.load(data.filepath('background.gif'))
 
-background_image = pyglet.image.load(data.filepath('background.gif'))
-shoot_sound = pyglet.resource.media('shoot.wav', streaming=False)
-bounce_sound = pyglet.resource.media('bounce.wav', streaming=False)
-splat_sound = pyglet.resource.media('splat.wav', streaming=False)
-dead_sound = pyglet.resource.media('death.wav', streaming=False)
-finished_sound = pyglet.resource.media('finished.wav', streaming=False)
+def load_sounds():
+    global sounds
 
-mouse_position = None
-keys_pressed = defaultdict(lambda: False)
+    # Effects are named after the simulation events that play them
+    sounds = sound.SoundPool()
+    sounds.add('shoot', data.sound('shoot.wav', acquire=True), limit=3)
+    sounds.add('bounce', data.sound('bounce.wav', acquire=True), limit=2)
+    sounds.add('splat', data.sound('splat.wav', acquire=True), limit=4)
+    sounds.add('dead', data.sound('death.wav', acquire=True), limit=1)
+    sounds.add('finished', data.sound('finished.wav', acquire=True), limit=1)
 
-class Tile(Sprite):
-    def __init__(self, index, x, y):
-        self.animation = False
+def load_hud():
+    global text_overlay, bar_outline, bar_fill_image
 
-        image = tileset[index]
+    text_overlay = pyglet.text.Label("", font_size=30)
+    text_overlay.anchor_x = text_overlay.anchor_y = 'center'
+    text_overlay.x = window.width / 2
+    text_overlay.y = window.height / 2
 
-        if image.width > TILE_SIZE:
-            self.animation = True
-            self.sequence = pyglet.image.ImageGrid(image, 1, image.width / TILE_SIZE)
+    bar_outline_image = data.image('bar_outline.png', atlas=True, acquire=True)
+    bar_outline = Sprite(bar_outline_image, 10, 10)
 
-            self.tile_time = 0
-            self.tile_frame = 0
-            self.tile_speed = 0.25
+    bar_fill_image = data.image('bar_fill.gif', atlas=True, acquire=True)
+    bar_fill_image.anchor_y = bar_fill_image.height / 2
+    bar_fill_image.start_width = 135
 
-            image = self.sequence[self.tile_frame]
+# The HUD packs its images into the atlas, so it comes after the sprites.
+# What these acquire from the data cache is used for the whole game and
+# never released.
+pending_assets = [load_crosshair, load_sprites, load_background, load_sounds, load_hud]
 
-        Sprite.__init__(self, image, x, y, batch=map_batch)
-        self.xpos = x
-        self.ypos = y
+def load_next_asset(dt=0):
+    if pending_assets:
+        loader = pending_assets.pop(0)
+        loader()
+        end_phase(loader.__name__[len('load_'):])
 
-    def update(self, dt):
-        self.x = self.xpos - world_offset[0]
-        self.y = self.ypos - world_offset[1]
+    if not pending_assets:
+        pyglet.clock.unschedule(load_next_asset)
+
+def load_assets():
+    while pending_assets:
+        load_next_asset()
 
-        if self.animation:
-            self.tile_time += dt
-            if self.tile_time >= self.tile_speed:
-                self.tile_time -= self.tile_speed
+def load_and_start(dt):
+    '''Load an asset a frame, as under the intro, then start the game.
 
-                self.tile_frame += 1
-                self.tile_frame %= len(self.sequence)
+    Used when there is no intro, so the first frame is drawn before the
+    sounds are decoded.
+    '''
+    if pending_assets:
+        load_next_asset()
+        return
+
+    on_eos()
+    end_phase('game')
 
-                self.image = self.sequence[self.tile_frame]
-                
+simulation = None
 
-class Goo(Sprite):
-    def __init__(self, x, y, dx, dy, goo_batch):
-        image = pyglet.image.load(data.filepath('goo.png'))
-        self.sequence = pyglet.image.ImageGrid(image, 1, 4)
+# Set by main() from the command line
+record_filename = None
+playback = None
 
-        self.splat_image = pyglet.image.load(data.filepath('splat.png'))
-        self.splat_image.anchor_x = self.splat_image.width / 2
+recorder = None
 
-        for sequence_image in self.sequence:
-            sequence_image.anchor_x = sequence_image.width / 2
-            sequence_image.anchor_y = sequence_image.height / 2
+# The simulation's world offset as drawn this frame, in whole pixels so
+# the tiles and the sprites drawn over them move together
+camera_offset = [0, 0]
 
-        Sprite.__init__(self, image, batch=goo_batch)
-        self.x = self.xpos = x
-        self.y = self.ypos = y
+# Tiles per side of a map chunk
+CHUNK_SIZE = 8
+map_chunks = None
 
-        self.speedx = dx
-        self.speedy = dy
+# Chunks of a streamed level around the view that are kept built
+STREAM_MARGIN = 1
+stream_range = None
 
-        self.animation_time = 0
-        self.animation_frame = 0
-        self.animation_speed = 0.25
+# Render the static tiles of each chunk to a texture the first time it is
+# drawn, turned off with --no-chunk-cache
+CACHE_STATIC_CHUNKS = True
 
-        self.splat = False
+# A baked chunk is one full chunk sized quad, so chunks with fewer static
+# tiles than this are cheaper to draw tile by tile
+BAKE_MIN_TILES = CHUNK_SIZE * CHUNK_SIZE / 2
 
-        self.hitbox = (0, 0, self.splat_image.width, self.splat_image.height)
+# Chunks off the view by more than this many chunks give up their textures,
+# and are baked again when they come back
+BAKE_MARGIN = 1
+baked_chunks = set()
+
+# Decode the music once and play it from memory rather than streaming it,
+# set with --music-cache
+CACHE_MUSIC = False
+
+# Run physics in fixed steps and interpolate between them when drawing
+FIXED_TIMESTEP = True
+FIXED_STEP = sim.STEP
+# Most steps run in one frame before the simulation gives up catching up
+MAX_STEPS = 5
+accumulator = 0
+
+# Seconds of each frame spent stepping a replay before drawing it
+PLAYBACK_BUDGET = 0.012
+
+class CameraGroup(pyglet.graphics.Group):
+    '''Translates world coordinates to the screen by the camera_offset.
+
+    Anything drawn in this group lives in world space, so scrolling is a
+    single matrix change instead of moving every sprite.
+    '''
+    def set_state(self):
+        glPushMatrix()
+        glTranslatef(-camera_offset[0], -camera_offset[1], 0)
+
+    def unset_state(self):
+        glPopMatrix()
+
+camera_group = CameraGroup()
+
+class TileAnimation(pyglet.graphics.Group):
+    '''Animates every tile of one tileset entry from a single clock.
+
+    The frames sit side by side in one texture, so changing frame is one
+    texture matrix translation for the whole group rather than new texture
+    coordinates on each tile.
+    '''
+    def __init__(self, image):
+        pyglet.graphics.Group.__init__(self, camera_group)
+
+        self.sequence = pyglet.image.ImageGrid(image, 1, image.width / TILE_SIZE)
+
+        self.tile_time = 0
+        self.tile_frame = 0
+        self.tile_speed = 0.25
+
+        first = self.sequence[0].get_texture().tex_coords
+        second = self.sequence[1].get_texture().tex_coords
+        self.frame_step = second[0] - first[0]
 
     def update(self, dt):
-        if not self.visible:
-            return
+        self.tile_time += dt
+        if self.tile_time >= self.tile_speed:
+            self.tile_frame += int(self.tile_time / self.tile_speed)
+            self.tile_frame %= len(self.sequence)
+            self.tile_time %= self.tile_speed
 
-        self.x = self.xpos - world_offset[0]
-        self.y = self.ypos - world_offset[1]
+    def set_state(self):
+        glMatrixMode(GL_TEXTURE)
+        glPushMatrix()
+        glTranslatef(self.tile_frame * self.frame_step, 0, 0)
+        glMatrixMode(GL_MODELVIEW)
 
-        if not self.splat:
-            self.xpos += self.speedx * dt
-            self.ypos += self.speedy * dt
+    def unset_state(self):
+        glMatrixMode(GL_TEXTURE)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
 
-            # Goo gets half gravity
-            self.speedy += (GRAVITY / 2) * dt
+# One animation per tileset index, kept across levels
+tile_animations = {}
 
-            self.animation_time += dt
-            if self.animation_time >= self.animation_speed:
-                self.animation_frame += int(self.animation_time / self.animation_speed)
-                self.animation_frame %= len(self.sequence)
-                self.animation_time %= self.animation_speed
+def get_tile_animation(index):
+    if index not in tile_animations:
+        tile_animations[index] = TileAnimation(tileset[index])
 
-            self.image = self.sequence[self.animation_frame]
+    return tile_animations[index]
 
-            x = self.xpos - 1
-            y = self.ypos - 1
+class Tile(Sprite):
+    def __init__(self, index, x, y, batch):
+        image = tileset[index]
+        group = camera_group
 
-            collisions = collide_world(x, y, 2, 2)
-            if collisions:
-                if world_map[collisions[0]] in [TILE_LAVA, TILE_PRINCESS]:
-                    self.visible = False
-                    return
+        if image.width > TILE_SIZE:
+            animation = get_tile_animation(index)
+            image = animation.sequence[0]
+            group = animation
+
+        Sprite.__init__(self, image, x, y, batch=batch, group=group, usage='static')
+
+def is_animated(index):
+    return tileset[index].width > TILE_SIZE
+
+class Chunk(object):
+    '''A CHUNK_SIZE square block of the map with its own batches.
+
+    Static tiles and animated tiles are kept in separate batches so the
+    static part can be baked into a single texture by bake(), which draw()
+    does the first time the chunk comes into view if it has at least
+    BAKE_MIN_TILES static tiles. unbake() frees the texture again.
+    '''
+    def __init__(self, chunk_x, chunk_y):
+        self.chunk_x = chunk_x
+        self.chunk_y = chunk_y
+        self.x = chunk_x * CHUNK_SIZE * TILE_SIZE
+        self.y = chunk_y * CHUNK_SIZE * TILE_SIZE
+
+        self.static_batch = pyglet.graphics.Batch()
+        self.dynamic_batch = pyglet.graphics.Batch()
+        self.tiles = []
+        # (index, x, y) of each static tile, to add them again in unbake()
+        self.static_tiles = []
+        self.animated_tiles = 0
+        self.cached = None
+        self.bake_tried = False
+
+    def add_tile(self, index, x, y):
+        if is_animated(index):
+            batch = self.dynamic_batch
+            self.animated_tiles += 1
+        else:
+            batch = self.static_batch
+            self.static_tiles.append((index, x, y))
+
+        self.tiles.append(Tile(index, x, y, batch))
+
+    def bake(self):
+        '''Render the static tiles into a texture drawn as one quad.
+
+        Returns False and leaves the chunk untouched if the framebuffer
+        could not be set up.
+        '''
+        size = CHUNK_SIZE * TILE_SIZE
+        texture = pyglet.image.Texture.create(size, size)
+
+        framebuffer = GLuint()
+        glGenFramebuffersEXT(1, byref(framebuffer))
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, framebuffer)
+        glFramebufferTexture2DEXT(GL_FRAMEBUFFER_EXT, GL_COLOR_ATTACHMENT0_EXT,
+                                  texture.target, texture.id, 0)
+
+        complete = glCheckFramebufferStatusEXT(GL_FRAMEBUFFER_EXT) == GL_FRAMEBUFFER_COMPLETE_EXT
+        if complete:
+            glPushAttrib(GL_VIEWPORT_BIT | GL_COLOR_BUFFER_BIT)
+            glViewport(0, 0, size, size)
+            glClearColor(0, 0, 0, 0)
+            glClear(GL_COLOR_BUFFER_BIT)
+
+            glMatrixMode(GL_PROJECTION)
+            glPushMatrix()
+            glLoadIdentity()
+            glOrtho(0, size, 0, size, -1, 1)
+            glMatrixMode(GL_MODELVIEW)
+            glPushMatrix()
+            glLoadIdentity()
+
+            # The tiles are blended into the cleared texture as usual, which
+            # multiplies their alpha by itself. That is exact for the tileset,
+            # whose pixels are all either opaque or fully transparent, and tiles
+            # are drawn unscaled at whole pixels so filtering adds no others.
+
+            # Undo the camera so the chunk origin lands on the texture origin
+            glTranslatef(camera_offset[0] - self.x, camera_offset[1] - self.y, 0)
+            self.static_batch.draw()
+
+            glPopMatrix()
+            glMatrixMode(GL_PROJECTION)
+            glPopMatrix()
+            glMatrixMode(GL_MODELVIEW)
+            glPopAttrib()
+
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, 0)
+        glDeleteFramebuffersEXT(1, byref(framebuffer))
+
+        if not complete:
+            return False
+
+        self.cached = Sprite(texture, self.x, self.y, group=camera_group)
 
-                self.splat = True
-                splat_sound.play()
+        tiles = []
+        for tile in self.tiles:
+            if tile.batch is self.static_batch:
+                tile.delete()
+            else:
+                tiles.append(tile)
+        self.tiles = tiles
 
-                surrounds = get_surrounds(collisions[0])
+        baked_chunks.add(self)
 
-                tile_x = (collisions[0] % map_width) * TILE_SIZE + (TILE_SIZE / 2)
-                tile_y = (collisions[0] / map_width) * TILE_SIZE + (TILE_SIZE / 2)
+        return True
 
-                if self.speedy < 0 and self.ypos > tile_y and not surrounds['top']:
-                    self.ypos = tile_y + (TILE_SIZE / 2)
-                elif self.speedy > 0 and self.ypos + self.image.anchor_y < tile_y and not surrounds['bottom']:
-                    self.ypos = tile_y - (TILE_SIZE / 2)
-                    self.rotation = 180
-                elif self.xpos < tile_x and not surrounds['left']:
-                    self.xpos = tile_x - (TILE_SIZE / 2)
-                    self.rotation = -90
-                elif self.xpos > tile_x and not surrounds['right']:
-                    self.xpos = tile_x + (TILE_SIZE / 2)
-                    self.rotation = 90
+    def unbake(self):
+        '''Free the baked texture and put the static tiles back.
 
-                self.image = self.splat_image
+        The chunk is baked again the next time it is drawn.
+        '''
+        # pyglet frees a texture once nothing refers to it
+        self.cached.delete()
+        self.cached = None
+        baked_chunks.discard(self)
 
+        for index, x, y in self.static_tiles:
+            self.tiles.append(Tile(index, x, y, self.static_batch))
 
-class Player(Sprite):
-    def __init__(self):
-        music_player.next()
+        self.bake_tried = False
 
-        self.start_level()
+    def delete(self):
+        for tile in self.tiles:
+            tile.delete()
+        self.tiles = []
 
-        music_player.seek(0)
-        music_player.play()
+        if self.cached is not None:
+            self.cached.delete()
+            self.cached = None
+            baked_chunks.discard(self)
 
-        bar_fill_image.width = bar_fill_image.start_width
+    def prepare(self):
+        '''Bake the chunk the first time this is called, if it is worth it.
+        '''
+        # Sparse chunks, and chunks of only lava or other animated tiles,
+        # are drawn from their batches
+        if not self.bake_tried:
+            self.bake_tried = True
+            if len(self.static_tiles) >= BAKE_MIN_TILES and CACHE_STATIC_CHUNKS and can_bake():
+                self.bake()
 
-        image = pyglet.image.load(data.filepath('player.png'))
-        self.sequence = pyglet.image.ImageGrid(image, 5, 2)
-        self.frame = -2
+    def draw(self):
+        self.prepare()
 
-        for sequence_image in self.sequence:
-            sequence_image.anchor_x = sequence_image.width / 2
-            sequence_image.anchor_y = sequence_image.height / 2
+        if self.cached is not None:
+            self.cached.draw()
+            frame_stats.draws += 1
+        elif self.static_tiles:
+            self.static_batch.draw()
+            frame_stats.batches += 1
 
-        Sprite.__init__(self, self.sequence[self.frame], 0, window.height / 2)
+        if self.animated_tiles:
+            self.dynamic_batch.draw()
+            frame_stats.batches += 1
 
-        self.hitbox = (10, 2, 38, 30)
+        frame_stats.tiles += len(self.tiles)
 
-        # Start at 1, height - 1
-        self.xpos = TILE_SIZE
-        self.ypos = TILE_SIZE
-        for index, value in enumerate(world_map):
-            if value == TILE_PLAYER:
-                self.xpos = (index % map_width) * TILE_SIZE
-                self.ypos = ((index / map_width) + 1) * TILE_SIZE
+def build_chunks(tile_map):
+    chunks = {}
 
-        self.speedx = self.speedy = 0
+    # Streamed levels are built a chunk at a time by stream_chunks()
+    if tile_map.streaming:
+        return chunks
 
-        self.walking = False
-        self.walk_speed = 100
-        self.walk_damping = 0.1
-        self.walk_frame_time = 0
-        self.walk_frame_speed = 0.25
+    for index, material in enumerate(tile_map.tiles):
+        if material > 0:
+            tile_x = index % tile_map.width
+            tile_y = index / tile_map.width
 
-        self.goo_batch = pyglet.graphics.Batch()
-        self.projectiles = []
+            chunk_key = (tile_x / CHUNK_SIZE, tile_y / CHUNK_SIZE)
+            chunk = chunks.get(chunk_key)
+            if chunk is None:
+                chunk = chunks[chunk_key] = Chunk(*chunk_key)
 
-        self.shoot_time = 0
-        self.shoot_speed = 0.25
-        self.shooting = False
+            chunk.add_tile(material, tile_x * TILE_SIZE, tile_y * TILE_SIZE)
 
-        self.bounce_height = 400
-        self.bounce_first = None
+    return chunks
 
-        self.finished = False
-        self.dead = False
+def can_bake():
+    return pyglet.gl.gl_info.have_extension('GL_EXT_framebuffer_object')
 
-    def start_level(self):
-        global text_overlay
-        text_overlay.text = ''
+def delete_chunks(chunks):
+    for chunk in chunks.values():
+        if chunk is not None:
+            chunk.delete()
 
-        global world_index, world, world_map, world_offset
+def build_chunk(tile_map, chunk_x, chunk_y):
+    '''Build one chunk of "tile_map", or return None if it has no tiles.
+    '''
+    chunk = None
 
-        world = json.load(data.load(worlds[world_index]))
-        world_map = world['tiles']
-        world_offset = [0, 0]
+    for tile_y in range(chunk_y * CHUNK_SIZE, min((chunk_y + 1) * CHUNK_SIZE, tile_map.height)):
+        for tile_x in range(chunk_x * CHUNK_SIZE, min((chunk_x + 1) * CHUNK_SIZE, tile_map.width)):
+            material = tile_map.tile(tile_x, tile_y)
+            if material > 0:
+                if chunk is None:
+                    chunk = Chunk(chunk_x, chunk_y)
 
-        global map_width, map_height, map_batch
-        
-        map_width = world['width']
-        map_height = len(world_map) / map_width
-        map_batch = pyglet.graphics.Batch()
+                chunk.add_tile(material, tile_x * TILE_SIZE, tile_y * TILE_SIZE)
 
-        music_file = pyglet.resource.media(world['music'])
-        music_player.queue(music_file)
+    return chunk
 
-        global tiles
+def stream_chunks(tile_map, chunk_x1, chunk_y1, chunk_x2, chunk_y2):
+    '''Build the chunks in view and delete those past STREAM_MARGIN.
 
-        tiles = []
-        for index, material in enumerate(world_map):
-            if material and material > 0:
-                tile = Tile(material, (index % map_width) * TILE_SIZE, (index / map_width) * TILE_SIZE)
-                tiles.append(tile)
+    Chunks without tiles are kept as None so they are only looked at once.
+    '''
+    global stream_range
 
-    def draw(self):
-        if self.xpos > window.width / 2:
-            self.x = window.width / 2
-        else:
-            self.x = self.xpos
+    for chunk_y in range(max(chunk_y1, 0), chunk_y2 + 1):
+        for chunk_x in range(max(chunk_x1, 0), chunk_x2 + 1):
+            if (chunk_x, chunk_y) not in map_chunks:
+                map_chunks[(chunk_x, chunk_y)] = build_chunk(tile_map, chunk_x, chunk_y)
 
-        if self.ypos > window.height / 2:
-            self.y = window.height / 2
-        else:
-            self.y = self.ypos
+    view_range = (chunk_x1, chunk_y1, chunk_x2, chunk_y2)
+    if view_range == stream_range:
+        return
+    stream_range = view_range
+
+    for chunk_x, chunk_y in list(map_chunks):
+        if (chunk_x < chunk_x1 - STREAM_MARGIN or chunk_x > chunk_x2 + STREAM_MARGIN or
+            chunk_y < chunk_y1 - STREAM_MARGIN or chunk_y > chunk_y2 + STREAM_MARGIN):
+            chunk = map_chunks.pop((chunk_x, chunk_y))
+            if chunk is not None:
+                chunk.delete()
+
+def unbake_chunks(chunk_x1, chunk_y1, chunk_x2, chunk_y2):
+    '''Free the textures of baked chunks more than BAKE_MARGIN off the view.
+    '''
+    for chunk in list(baked_chunks):
+        # Chunks prefetched for the next level are left alone
+        if map_chunks.get((chunk.chunk_x, chunk.chunk_y)) is not chunk:
+            continue
 
-        Sprite.draw(self)
+        if (chunk.chunk_x < chunk_x1 - BAKE_MARGIN or chunk.chunk_x > chunk_x2 + BAKE_MARGIN or
+            chunk.chunk_y < chunk_y1 - BAKE_MARGIN or chunk.chunk_y > chunk_y2 + BAKE_MARGIN):
+            chunk.unbake()
 
-        self.goo_batch.draw()
-        
-    def shoot(self, x, y):
-        if self.dead or self.finished:
-            return
+def chunk_range(offset):
+    '''The first and last chunk x and y in view from camera "offset".
+    '''
+    chunk_pixels = CHUNK_SIZE * TILE_SIZE
 
-        if len(self.projectiles) >= world['max_goo']:
-            return
+    return (int(offset[0] // chunk_pixels), int(offset[1] // chunk_pixels),
+            int((offset[0] + window.width) // chunk_pixels),
+            int((offset[1] + window.height) // chunk_pixels))
 
-        dx = x - self.x
-        dy = y - self.y
+def visible_chunks():
+    '''Yield the map chunks overlapping the camera rectangle.
+    '''
+    chunk_x1, chunk_y1, chunk_x2, chunk_y2 = chunk_range(camera_offset)
 
-        goo = Goo(self.xpos, self.ypos, dx, dy, self.goo_batch)
-        shoot_sound.play()
+    tile_map = simulation.tile_map
+    if tile_map.streaming:
+        stream_chunks(tile_map, chunk_x1, chunk_y1, chunk_x2, chunk_y2)
 
-        self.projectiles.append(goo)
+    unbake_chunks(chunk_x1, chunk_y1, chunk_x2, chunk_y2)
 
-        self.shooting = True
+    for chunk_y in range(chunk_y1, chunk_y2 + 1):
+        for chunk_x in range(chunk_x1, chunk_x2 + 1):
+            chunk = map_chunks.get((chunk_x, chunk_y))
+            if chunk is not None:
+                yield chunk
 
-        goo_left = world['max_goo'] - len(self.projectiles)
-        bar_fill_image.width = max((bar_fill_image.start_width / float(world['max_goo'])) * goo_left, 1)
+class GooSprite(Sprite):
+    def __init__(self, batch):
+        self.sequence = data.grid('goo.png', 1, 4, atlas=True, centre=True)
 
-    def update_offset(self):
-        global world_offset
-        world_offset = [self.xpos - (window.width / 2), self.ypos - (window.height / 2)]
-        world_offset[0] = max(0, world_offset[0])
-        world_offset[1] = max(0, world_offset[1])
+        self.splat_image = data.image('splat.png', atlas=True)
+        self.splat_image.anchor_x = self.splat_image.width / 2
 
-    def update(self, dt):
-        global player
+        Sprite.__init__(self, self.sequence[0], batch=batch, group=camera_group)
 
-        if self.dead:
-            if keys_pressed[key.SPACE]:
-                player = Player()
+        self.revision = None
 
-            self.speedy += GRAVITY * dt
+    def sync(self, goo):
+        self.revision = goo.revision
 
-            self.xpos += self.speedx * dt
-            self.ypos += self.speedy * dt
-            self.rotation += 180 * dt
+        self.visible = goo.visible
+        self.rotation = goo.rotation
 
-            self.update_offset()
+        if goo.splat:
+            self.image = self.splat_image
+            self.set_position(goo.xpos, goo.ypos)
 
-            for goo in self.projectiles:
-                goo.update(dt)
-            
-            return
+    def move(self, goo, alpha):
+        self.image = self.sequence[goo.animation_frame]
+        self.set_position(interpolate(goo.previous_xpos, goo.xpos, alpha),
+                          interpolate(goo.previous_ypos, goo.ypos, alpha))
 
-        if self.finished:
-            if keys_pressed[key.SPACE]:
-                global world_index
-                world_index += 1
+class GooLayer(object):
+    '''Sprites for the slots of a simulation goo pool.
 
-                if world_index >= len(worlds):
-                    pyglet.app.exit()
-                    return
+    Goo in flight is moved every frame; everything else is only touched
+    when the simulation changes it.
+    '''
+    def __init__(self, goo_pool):
+        self.goo_pool = goo_pool
+        self.batch = pyglet.graphics.Batch()
+        self.sprites = []
 
-                player = Player()
+    def draw(self, alpha):
+        self.goo_pool.sync()
 
-            self.rotation += 180 * dt
+        slots = self.goo_pool.slots
 
-            return
+        while len(self.sprites) < len(slots):
+            self.sprites.append(GooSprite(self.batch))
 
-        if self.walking:
-            if keys_pressed[key.A]:
-                self.speedx = -self.walk_speed
-            elif keys_pressed[key.D]:
-                self.speedx = self.walk_speed
-            else:
-                if self.speedx > 1:
-                    self.speedx -= self.walk_speed * self.walk_damping
-                elif self.speedx < -1:
-                    self.speedx += self.walk_speed * self.walk_damping
-                else:
-                    self.speedx = 0
-        else:
-            if keys_pressed[key.A]:
-                if self.speedx > -self.walk_speed:
-                    self.speedx -= self.walk_speed * 3 * dt
-                    self.speedx = max(self.speedx, -self.walk_speed)
-            elif keys_pressed[key.D]:
-                if self.speedx < self.walk_speed:
-                    self.speedx += self.walk_speed * 3 * dt
-                    self.speedx = min(self.speedx, self.walk_speed)
-
-        oldx = self.xpos - self.image.anchor_x
-        oldy = self.ypos - self.image.anchor_y
-
-        self.xpos += self.speedx * dt
-
-        if self.xpos < self.image.anchor_x:
-            self.xpos = self.image.anchor_x
-            self.speedx = 0
-
-        if self.xpos > TILE_SIZE * map_width - self.image.anchor_x:
-            self.xpos = TILE_SIZE * map_width - self.image.anchor_x
-            self.speedx = 0
-
-        self.speedy += GRAVITY * dt
-        self.ypos += self.speedy * dt
-
-        x = self.xpos - self.image.anchor_x
-        y = self.ypos - self.image.anchor_y
-
-        self.walking = False
-
-        # Find the tile collisions
-        collisions = collide_world(x + self.hitbox[0],
-                                   y + self.hitbox[1],
-                                   self.hitbox[2] - self.hitbox[0],
-                                   self.hitbox[3] - self.hitbox[1])
-
-        if collisions:
-            for collision in collisions:
-                surrounds = get_surrounds(collision)
-
-                if world_map[collision] == TILE_PRINCESS:
-                    self.frame = -1
-                    self.finished = True
-                    
-                    music_player.pause()
-                    finished_sound.play()
-
-                    if world_index >= len(worlds) - 1:
-                        text_overlay.text = "You won the game ^_^"
-                    else:
-                        text_overlay.text = "Weeeee, press space for next level"
-
-                tile_x = (collision % map_width) * TILE_SIZE + (TILE_SIZE / 2)
-                tile_y = (collision / map_width) * TILE_SIZE + (TILE_SIZE / 2)
-
-                if self.speedy < 0 and oldy > tile_y and not surrounds['top']:
-                    self.ypos = tile_y + (TILE_SIZE / 2) + self.image.anchor_y - self.hitbox[1]
-                    self.speedy = 0
-                    self.walking = True
-
-                    if world_map[collision] == TILE_LAVA:
-                        self.speedx = random.randint(-self.walk_speed, self.walk_speed)
-                        self.speedy = random.randint(self.walk_speed, self.walk_speed * 2)
-                        self.frame = -1
-                        self.dead = True
-
-                        music_player.pause()
-                        dead_sound.play()
-
-                        text_overlay.text = "YOU DIED. PRESS SPACE"
-
-                elif self.speedy > 0 and oldy + TILE_SIZE < tile_y and not surrounds['bottom']:
-                    self.ypos = tile_y - (TILE_SIZE / 2) - self.image.anchor_y + (self.image.height - self.hitbox[3])
-                    self.speedy = 0
-
-                elif self.speedx > 0 and oldx + TILE_SIZE < tile_x and not surrounds['left']:
-                    self.xpos = tile_x - (TILE_SIZE / 2) - self.image.anchor_x + self.hitbox[0]
-                    self.speedx = 0
-
-                elif self.speedx < 0 and oldx > tile_x and not surrounds['right']:
-                    self.xpos = tile_x + (TILE_SIZE / 2) + self.image.anchor_x - (self.image.width - self.hitbox[2])
-                    self.speedx = 0
-
-        if self.shooting:
-            self.shoot_time += dt
-
-            if self.walking:
-                self.frame = -4
-            else:
-                self.frame = 0
-                    
-            if self.shoot_time >= self.shoot_speed:
-                self.shoot_time = 0
-                self.shooting = False
-
-                if self.walking:
-                    self.frame = -2
-                else:
-                    self.frame = 2
-
-        elif self.walking:
-            if self.frame not in [-1, -2]:
-                self.frame = -1
-
-            self.walk_frame_time += dt
-            if self.walk_frame_time >= self.walk_frame_speed:
-                if self.frame == -1:
-                    self.frame = -2
-                else:
-                    self.frame = -1
-                    
-                self.walk_frame_time = 0
+        synced = 0
+        for goo, sprite in zip(slots, self.sprites):
+            if goo.revision != sprite.revision:
+                sprite.sync(goo)
+                synced += 1
 
-        else:
-            self.frame = 2
+        flying = self.goo_pool.flying
+        for goo in flying:
+            self.sprites[goo.slot].move(goo, alpha)
 
-        if self.walking:
-            self.bounce_first = None
+        self.batch.draw()
 
-        self.image = self.sequence[self.frame]
+        frame_stats.goos += synced + len(flying)
+        frame_stats.batches += 1
 
-        if mouse_position and mouse_position[0] < self.x:
-            self.image = self.image.get_transform(flip_x = True)
+class PlayerSprite(Sprite):
+    def __init__(self, player):
+        self.player = player
 
-        self.update_offset()
+        self.sequence = data.grid('player.png', 5, 2, atlas=True, centre=True)
 
-        for goo in self.projectiles:
-            goo.update(dt)
+        Sprite.__init__(self, self.sequence[player.frame], 0, window.height / 2)
 
-            if goo.splat and goo.visible and collide_objects(self, goo):
-                if self.bounce_first is None:
-                    self.bounce_first = goo.rotation
+        self.goo_layer = GooLayer(player.goo_pool)
 
-                rotations = [goo.rotation]
-                if math.fabs(goo.rotation - self.bounce_first) != 180:
-                    rotations.append(self.bounce_first)
+    def draw(self, alpha=1):
+        player = self.player
 
-                for rotation in rotations:
-                    if rotation == 180:
-                        self.speedy = -self.bounce_height
-                    elif rotation == -90:
-                        self.speedx = -self.bounce_height
-                    elif rotation == 90:
-                        self.speedx = self.bounce_height
-                    else:
-                        self.speedy = self.bounce_height
+        image = self.sequence[player.frame]
+        if player.flip:
+            image = image.get_transform(flip_x = True)
 
-                bounce_sound.play()
+        self.image = image
+        self.rotation = player.rotation
 
+        self.x = interpolate(player.previous_xpos, player.xpos, alpha) - camera_offset[0]
+        self.y = interpolate(player.previous_ypos, player.ypos, alpha) - camera_offset[1]
 
-def get_surrounds(index):
-    surrounds = {}
-    
-    if index % map_width > 0:
-        surrounds['left'] = world_map[index - 1]
-        if surrounds['left'] < 0:
-            surrounds['left'] = None
-    else:
-        surrounds['left'] = None
-        
-    if index % map_width < map_width - 1:
-        surrounds['right'] = world_map[index + 1]
-        if surrounds['right'] < 0:
-            surrounds['right'] = None
-    else:
-        surrounds['right'] = None
+        Sprite.draw(self)
 
-    if index < len(world_map) - map_width:
-        surrounds['top'] = world_map[index + map_width]
-        if surrounds['top'] < 0:
-            surrounds['top'] = None
-    else:
-        surrounds['top'] = None
+        self.goo_layer.draw(alpha)
+
+def open_music(filename):
+    '''Open a level's music, decoded and held in the data cache with
+    --music-cache until start_level() moves on from it.
+    '''
+    if CACHE_MUSIC:
+        return data.music(filename, acquire=True)
+
+    return pyglet.media.load(data.filepath(filename))
+
+# The music of the level being played
+level_music = None
+
+# (chunks, music) made ready by prefetch_level() for each world index
+prefetched = {}
+prefetch = None
+
+def prefetch_level(index):
+    '''Get world "index" ready to play, yielding between the pieces.
+    '''
+    level = simulation.prepare_level(index)
+    yield
+
+    chunks = build_chunks(level.tile_map)
+    done = False
+    try:
+        yield
+
+        # Bake what the first frame shows, a chunk at a time, so the level
+        # does not start with a burst of baking
+        spawn_x, spawn_y = level.spawn
+        chunk_x1, chunk_y1, chunk_x2, chunk_y2 = chunk_range(
+            (max(0, spawn_x - window.width / 2), max(0, spawn_y - window.height / 2)))
+        for chunk_y in range(chunk_y1, chunk_y2 + 1):
+            for chunk_x in range(chunk_x1, chunk_x2 + 1):
+                chunk = chunks.get((chunk_x, chunk_y))
+                if chunk is not None:
+                    chunk.prepare()
+                    yield
+
+        music_file = open_music(level.world['music'])
+        prefetched[index] = (chunks, music_file)
+        done = True
+    finally:
+        # Stopped part way, by stop_prefetch() or an error
+        if not done:
+            delete_chunks(chunks)
+
+def prefetch_next(dt):
+    # The clock can still call this in the tick stop_prefetch() ran in
+    if prefetch is None:
+        return
 
-    if index > map_width:
-        surrounds['bottom'] = world_map[index - map_width]
-        if surrounds['bottom'] < 0:
-            surrounds['bottom'] = None
-    else:
-        surrounds['bottom'] = None
+    try:
+        next(prefetch)
+    except StopIteration:
+        stop_prefetch()
 
-    return surrounds
+def start_prefetch(index):
+    '''Prepare world "index" over the next few frames.
+    '''
+    global prefetch
 
-def collide_objects(a, b):
-    a_x1 = a.xpos - a.image.anchor_x + a.hitbox[0]
-    a_x2 = a_x1 + (a.hitbox[2] - a.hitbox[0])
-    a_y1 = a.ypos - a.image.anchor_y + a.hitbox[1]
-    a_y2 = a_y1 + (a.hitbox[3] - a.hitbox[1])
+    if prefetch is None and index not in prefetched:
+        prefetch = prefetch_level(index)
+        pyglet.clock.schedule(prefetch_next)
 
-    b_x1 = b.xpos - b.image.anchor_x + b.hitbox[0]
-    b_x2 = b_x1 + (b.hitbox[2] - b.hitbox[0])
-    b_y1 = b.ypos - b.image.anchor_y + b.hitbox[1]
-    b_y2 = b_y1 + (b.hitbox[3] - b.hitbox[1])
+def stop_prefetch():
+    global prefetch
 
-    if a_x1 > b_x2:
-        return False
+    prefetch = None
+    pyglet.clock.unschedule(prefetch_next)
 
-    if a_x2 < b_x1:
-        return False
+def start_level():
+    text_overlay.text = ''
 
-    if a_y1 > b_y2:
-        return False
+    # Anything not prefetched in time is loaded now
+    stop_prefetch()
+    chunks, music_file = prefetched.pop(simulation.world_index, (None, None))
 
-    if a_y2 < b_y1:
-        return False
+    music_player.next()
 
-    return True
+    if music_file is None:
+        music_file = open_music(simulation.world['music'])
+    music_player.queue(music_file)
 
-def collide_world(x, y, width, height):
-    collisions = []
+    # The last level's decoded track may now be evicted
+    global level_music
+    if level_music is not None:
+        data.release(level_music)
+    level_music = music_file
 
-    world_x1 = int(math.floor(x / float(TILE_SIZE)))
-    world_x2 = int(math.ceil((x + width) / float(TILE_SIZE)))
-    world_y1 = int(math.floor(y / float(TILE_SIZE)))
-    world_y2 = int(math.ceil((y + height) / float(TILE_SIZE)))
+    music_player.seek(0)
+    music_player.play()
 
-    for i in range(world_y1, world_y2):
-        y_index = i * map_width
+    bar_fill_image.width = bar_fill_image.start_width
 
-        if y_index < 0 or y_index >= len(world_map):
-            continue
+    global map_chunks, stream_range, player_sprite
 
-        if world_x2 < 0 or world_x1 >= map_width:
-            continue
+    if chunks is None:
+        chunks = build_chunks(simulation.tile_map)
+
+    # The last level's tiles and baked textures
+    if map_chunks is not None:
+        delete_chunks(map_chunks)
+    map_chunks = chunks
+    stream_range = None
+
+    player_sprite = PlayerSprite(simulation.player)
+
+def restart_level():
+    '''Reset the HUD and music for the level starting again.
+
+    The map chunks and player sprite are kept, the simulation reuses the
+    same level and player.
+    '''
+    text_overlay.text = ''
 
-        for index in range(y_index + world_x1, y_index + world_x2):
-            tile = world_map[index]
-            if tile and tile > 0:
-                collisions.append(index)
+    music_player.seek(0)
+    music_player.play()
 
-    return collisions
+    bar_fill_image.width = bar_fill_image.start_width
 
-text_overlay = pyglet.text.Label("", font_size=30)
-text_overlay.anchor_x = text_overlay.anchor_y = 'center'
-text_overlay.x = window.width / 2
-text_overlay.y = window.height / 2
+def handle_events():
+    max_goo = simulation.world['max_goo']
+
+    for event in simulation.events:
+        if event == 'level':
+            start_level()
+
+        elif event == 'restart':
+            restart_level()
+
+        elif event == 'shoot':
+            sounds.play('shoot')
+
+            goo_left = max_goo - simulation.player.goo_fired
+            bar_fill_image.width = max((bar_fill_image.start_width / float(max_goo)) * goo_left, 1)
+
+        elif event == 'splat':
+            sounds.play('splat')
+
+        elif event == 'bounce':
+            sounds.play('bounce')
+
+        elif event == 'dead':
+            music_player.pause()
+            sounds.play('dead')
+
+            text_overlay.text = "YOU DIED. PRESS SPACE"
+
+        elif event == 'finished':
+            music_player.pause()
+            sounds.play('finished')
+
+            if simulation.last_level():
+                text_overlay.text = "You won the game ^_^"
+            else:
+                text_overlay.text = "Weeeee, press space for next level"
+
+                start_prefetch(simulation.world_index + 1)
+
+        elif event == 'complete':
+            pyglet.app.exit()
+
+    del simulation.events[:]
 
 music_player = pyglet.media.Player()
 music_player.eos_action = music_player.EOS_LOOP
@@ -589,19 +775,77 @@ intro = True
 
 intro_player = pyglet.media.Player()
 
-bar_outline_image = pyglet.resource.image('bar_outline.png')
-bar_outline = Sprite(bar_outline_image, 10, 10)
+player_sprite = None
+
+class FrameStats(object):
+    '''Rolling update and draw times with counts from the last frame.
+
+    The numbers are only laid out again a couple of times a second, so
+    the overlay is cheap enough to leave on.
+    '''
+    SAMPLES = 60
+    REFRESH = 0.5
 
-bar_fill_image = pyglet.resource.image('bar_fill.gif')
-bar_fill_image.anchor_y = bar_fill_image.height / 2
-bar_fill_image.start_width = 135
+    def __init__(self):
+        self.visible = False
+
+        self.update_times = deque(maxlen=self.SAMPLES)
+        self.draw_times = deque(maxlen=self.SAMPLES)
+
+        # Counted while drawing the current frame; draws are sprites and
+        # images drawn on their own rather than through a batch
+        self.tiles = 0
+        self.goos = 0
+        self.batches = 0
+        self.draws = 0
+
+        self.refreshed = 0
+        self.label = None
+
+    def begin_frame(self):
+        self.tiles = self.goos = self.batches = self.draws = 0
+
+    def refresh(self, now):
+        self.refreshed = now
+
+        if self.label is None:
+            self.label = pyglet.text.Label('', font_size=10, x=10, y=window.height - 10,
+                                           anchor_y='top', multiline=True,
+                                           width=window.width - 20)
+
+        update_times = self.update_times or [0]
+        draw_times = self.draw_times or [0]
 
-tiles = None
+        cache = data.cache
 
-player = None
+        self.label.text = ('update %.2fms (max %.2f)  draw %.2fms (max %.2f)  '
+                           'tiles %d  goos %d  batches %d  draws %d  voices %d\n'
+                           'cache %.1fMB  hits %d  misses %d  evictions %d' % (
+            sum(update_times) * 1000 / len(update_times), max(update_times) * 1000,
+            sum(draw_times) * 1000 / len(draw_times), max(draw_times) * 1000,
+            self.tiles, self.goos, self.batches, self.draws, sounds.playing(),
+            cache.size / 1048576.0, cache.hits, cache.misses, cache.evictions))
+
+    def draw(self, now):
+        if now - self.refreshed >= self.REFRESH:
+            self.refresh(now)
+
+        self.label.draw()
+
+frame_stats = FrameStats()
+
+first_frame = True
 
 @window.event
 def on_draw():
+    start = clock()
+    frame_stats.begin_frame()
+
+    global first_frame
+    if first_frame:
+        first_frame = False
+        end_phase('first frame')
+
     window.clear()
 
     if intro:
@@ -609,36 +853,68 @@ def on_draw():
         if texture:
             texture.blit(0, 0)
     else:
+        if FIXED_TIMESTEP and playback is None:
+            alpha = accumulator / FIXED_STEP
+        else:
+            alpha = 1
+
+        camera_offset[:] = [int(offset) for offset in simulation.camera(alpha)]
+
         background_image.blit(0, 0)
-        map_batch.draw()
-        player.draw()
+        for chunk in visible_chunks():
+            chunk.draw()
+        player_sprite.draw(alpha)
 
         bar_fill_image.blit(bar_outline.x + 4, bar_outline.y + (bar_outline.height / 2))
         bar_outline.draw()
 
         text_overlay.draw()
 
+        # Background, player, bar fill, bar outline and text
+        frame_stats.draws += 5
+
+        if frame_stats.visible:
+            now = clock()
+            frame_stats.draw_times.append(now - start)
+            frame_stats.draw(now)
+
+def set_key(symbol, pressed):
+    if playback is not None:
+        return
+
+    keys = simulation.input
+
+    if symbol == key.A:
+        keys.left = pressed
+    elif symbol == key.D:
+        keys.right = pressed
+    elif symbol == key.SPACE:
+        keys.space = pressed
+
 @window.event
 def on_key_press(symbol, modifiers):
     if intro:
         return
 
-    keys_pressed[symbol] = True
+    if symbol == key.F3:
+        frame_stats.visible = not frame_stats.visible
+        return
+
+    set_key(symbol, True)
 
 @window.event
 def on_key_release(symbol, modifiers):
     if intro:
         return
 
-    keys_pressed[symbol] = False
+    set_key(symbol, False)
 
 @window.event
 def on_mouse_motion(x, y, dx, dy):
-    if intro:
+    if intro or playback is not None:
         return
 
-    global mouse_position
-    mouse_position = (x, y)
+    simulation.input.mouse_position = (x, y)
 
 @window.event
 def on_mouse_press(x, y, buttons, modifiers):
@@ -647,17 +923,66 @@ def on_mouse_press(x, y, buttons, modifiers):
         on_eos()
         return
 
+    if playback is not None:
+        return
+
     if buttons == mouse.LEFT:
-        player.shoot(x, y)
+        simulation.shoot(x, y)
+        handle_events()
+
+def step(dt):
+    simulation.step(dt)
+
+    for animation in tile_animations.values():
+        animation.update(dt)
+
+    handle_events()
 
 def update(dt):
     if intro:
         return
 
-    player.update(dt)
+    if not frame_stats.visible:
+        advance(dt)
+        return
 
-    for tile in tiles:
-        tile.update(dt)
+    start = clock()
+    advance(dt)
+    frame_stats.update_times.append(clock() - start)
+
+def advance(dt):
+    if playback is not None:
+        # As many recorded ticks as fit in the budget, and only the last
+        # of them is drawn
+        deadline = clock() + PLAYBACK_BUDGET
+        while True:
+            if playback.finished(simulation):
+                pyglet.app.exit()
+                return
+
+            playback.apply(simulation)
+            step(playback.step)
+
+            if clock() >= deadline:
+                return
+
+    if not FIXED_TIMESTEP:
+        step(dt)
+        return
+
+    global accumulator
+    accumulator += dt
+
+    steps = 0
+    while accumulator >= FIXED_STEP:
+        if steps == MAX_STEPS:
+            # Too far behind, drop the backlog rather than spiral
+            accumulator %= FIXED_STEP
+            break
+
+        step(FIXED_STEP)
+        accumulator -= FIXED_STEP
+        steps += 1
 
 # This is fired after the intro video
 @intro_player.event
@@ -665,18 +990,56 @@ def on_eos():
     global intro
     intro = False
 
-    window.set_mouse_cursor(crosshair)
-    pyglet.clock.schedule_interval(update, 1/60.0)
+    # Whatever the intro, or the frames before a click, did not leave time for
+    load_assets()
+    pyglet.clock.unschedule(load_and_start)
 
-    global player
-    player = Player()
+    window.set_mouse_cursor(crosshair)
+    if FIXED_TIMESTEP or playback is not None:
+        pyglet.clock.schedule(update)
+    else:
+        pyglet.clock.schedule_interval(update, 1/60.0)
 
-if pyglet.media.have_avbin:
-    intro_video = pyglet.resource.media('intro.avi')
-    intro_player.queue(intro_video)
-    intro_player.play()
-else:
-    on_eos()
+    global simulation, recorder
+    if playback is not None:
+        simulation = playback.simulation(window.width, window.height)
+    else:
+        simulation = sim.Simulation(view_width=window.width, view_height=window.height)
+
+    simulation.start_level()
+    handle_events()
+
+    # Only fixed steps can be replayed exactly
+    if record_filename is not None and FIXED_TIMESTEP:
+        recorder = replay.Recorder(simulation, record_filename, FIXED_STEP)
+
+def main(options=None):
+    global record_filename, playback, log_startup, CACHE_MUSIC, CACHE_STATIC_CHUNKS
+
+    if options is not None:
+        record_filename = options.record
+        CACHE_MUSIC = options.music_cache
+        CACHE_STATIC_CHUNKS = options.chunk_cache
+        frame_stats.visible = log_startup = options.stats
+        if options.replay:
+            playback = replay.Replay(options.replay)
+
+    if log_startup:
+        for name, seconds in startup_phases:
+            print_phase(name, seconds)
+
+    if pyglet.media.have_avbin and playback is None:
+        intro_video = pyglet.media.load(data.filepath('intro.avi'))
+        intro_player.queue(intro_video)
+        intro_player.play()
+        end_phase('intro')
+
+        # The intro only needs the window; load the rest between its frames
+        pyglet.clock.schedule(load_next_asset)
+    else:
+        pyglet.clock.schedule(load_and_start)
 
-def main():
     pyglet.app.run()
+
+    if recorder is not None:
+        recorder.close(simulation)
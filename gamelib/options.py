@@ -0,0 +1,54 @@
+'''Command line options for run_game.py.
+'''
+
+import optparse
+
+import bench
+
+def parse(args):
+    parser = optparse.OptionParser(usage='%prog [options] [level ...]')
+
+    parser.add_option('--record', metavar='FILE',
+                      help='record the input of this game to FILE')
+    parser.add_option('--replay', metavar='FILE',
+                      help='play back a recording made with --record, as fast as possible')
+    parser.add_option('--headless', action='store_true', default=False,
+                      help='run without a window or sound (with --replay; --bench and '
+                           '--playtest always do)')
+    parser.add_option('--music-cache', action='store_true', default=False,
+                      help='decode the music once and loop it from memory')
+    parser.add_option('--no-chunk-cache', dest='chunk_cache', action='store_false', default=True,
+                      help='draw the map tile by tile instead of baking it into textures')
+    parser.add_option('--vector-goo', action='store_true', default=False,
+                      help='step flying goo with NumPy, if it is installed')
+    parser.add_option('--stats', action='store_true', default=False,
+                      help='start with the frame statistics overlay shown (toggle with F3)')
+
+    parser.add_option('--bench', action='store_true', default=False,
+                      help='benchmark the given levels, or every level, without a window')
+    parser.add_option('--ticks', type='int',
+                      help='simulation ticks per benchmarked or playtested level '
+                           '[default: %d, or the whole of a recording]' % bench.TICKS)
+    parser.add_option('--output', metavar='FILE',
+                      help='save the benchmark results to FILE as JSON')
+    parser.add_option('--baseline', metavar='FILE',
+                      help='compare the benchmark with results saved by --output')
+
+    parser.add_option('--playtest', action='store_true', default=False,
+                      help='play the given levels, or every level, with scripted input '
+                           'and their recorded completions, and any given .rep recordings, '
+                           'without a window')
+    parser.add_option('--processes', type='int',
+                      help='processes to playtest with [default: one per CPU]')
+
+    options, args = parser.parse_args(args)
+
+    if options.headless and not (options.replay or options.bench or options.playtest):
+        parser.error('--headless needs --replay, --bench or --playtest')
+
+    return options, args
+
+def headless(options):
+    '''Whether the options ask for a command that needs no window.
+    '''
+    return options.headless or options.bench or options.playtest
@@ -0,0 +1,145 @@
+'''Headless playtests of levels, run in parallel on a process pool.
+
+Every level is played once with each of the scripted inputs in SCRIPTS,
+once with its recorded completion from the data directory if it has one,
+and once with each recording given, until the player reaches the princess,
+dies in lava or runs out of ticks. The outcome and the time taken per tick
+are reported for each run.
+
+The scripts are smoke tests: they walk, bounce and shoot about until they
+die or time out, and none of them can finish a shipped level, which takes
+aimed bounces off goo. That a level can still be completed is shown by
+its recorded completion, data/<level>.rep, which has to be recorded again
+with --record when a change to the level or the rules breaks it.
+'''
+
+import multiprocessing
+import os
+import timeit
+
+import bench
+from bench import shoot_at
+import data
+import replay
+import sim
+
+clock = timeit.default_timer
+
+def walk_right(simulation):
+    simulation.input.right = True
+
+def walk_left(simulation):
+    simulation.input.left = True
+
+def bounce_right(simulation):
+    '''Walk right, splatting goo underfoot to bounce off.
+    '''
+    simulation.input.right = True
+    if simulation.tick % 45 == 0:
+        shoot_at(simulation, 30, -60)
+
+SCRIPTS = {
+    'walk-right': walk_right,
+    'walk-left': walk_left,
+    'bounce-right': bounce_right,
+    # The benchmark's script, without its restarts
+    'wander': bench.wander,
+}
+
+def outcome(simulation):
+    player = simulation.player
+    if player.finished:
+        return 'princess'
+    if player.dead:
+        return 'lava'
+    return None
+
+def completion(world):
+    '''The filename of the recorded completion of "world", or None.
+    '''
+    filename = data.filepath(os.path.splitext(world)[0] + replay.EXTENSION)
+    if os.path.exists(filename):
+        return filename
+    return None
+
+def run(job):
+    '''Play one (world, script, ticks) job and return a result dict.
+
+    "script" is a name from SCRIPTS or the filename of a recording. With
+    "ticks" None a script plays for bench.TICKS and a recording to its end.
+    '''
+    world, script, ticks = job
+
+    if script in SCRIPTS:
+        simulation = sim.Simulation([world], seed=0)
+        drive = SCRIPTS[script]
+        step = sim.STEP
+        if ticks is None:
+            ticks = bench.TICKS
+    else:
+        recording = replay.Replay(script)
+        simulation = recording.simulation()
+        world = simulation.worlds[simulation.world_index]
+        ticks = bench.limit(ticks, recording)
+        drive = recording.apply
+        step = recording.step
+
+    simulation.start_level()
+
+    result = None
+    start = clock()
+    while result is None and simulation.tick < ticks:
+        drive(simulation)
+        simulation.step(step)
+        del simulation.events[:]
+
+        result = outcome(simulation)
+    elapsed = clock() - start
+
+    return {
+        'world': world,
+        'script': os.path.basename(script),
+        'outcome': result or 'timeout',
+        'ticks': simulation.tick,
+        'tick_us': elapsed / max(simulation.tick, 1) * 1000000,
+    }
+
+def report(results, elapsed):
+    counts = {}
+    for result in results:
+        print('%-14s %-16s %-8s %6d ticks  %6.1fus/tick' % (
+            result['world'], result['script'], result['outcome'],
+            result['ticks'], result['tick_us']))
+        counts[result['outcome']] = counts.get(result['outcome'], 0) + 1
+
+    print('%d runs in %.2fs: %d reached the princess, %d died in lava, %d timed out' % (
+        len(results), elapsed, counts.get('princess', 0), counts.get('lava', 0),
+        counts.get('timeout', 0)))
+
+    if not any(result['script'].endswith(replay.EXTENSION) for result in results):
+        print('The scripts cannot finish a level; only recordings check completion')
+
+def main(worlds, recordings=(), ticks=None, processes=None):
+    '''Playtest each of "worlds" with every script and its recorded
+    completion, and each recording.
+    '''
+    completions = [completion(world) for world in worlds]
+    recordings = [filename for filename in completions if filename] + list(recordings)
+
+    jobs = [(world, script, ticks) for world in worlds for script in sorted(SCRIPTS)]
+    jobs += [(None, recording, ticks) for recording in recordings]
+
+    start = clock()
+    if processes == 1 or len(jobs) == 1:
+        results = [run(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(run, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    report(results, clock() - start)
+
+    return 0
@@ -0,0 +1,185 @@
+'''Recording and playback of the input to a simulation.
+
+A recording holds the seed, step length and levels a game was started
+with, followed by every change of input and every shot, stamped with the
+tick it happened on. Feeding it back into a new simulation repeats the
+game exactly.
+
+The file is little endian:
+
+    header  "BPRP", version (B), seed (I), step (d), world index (B),
+            number of worlds (B), then each world name as length (B) + bytes
+    record  tick (I), kind (B), then for
+              KEYS   a mask (B) of LEFT_KEY, RIGHT_KEY and SPACE_KEY
+              MOUSE  x, y (hh)
+              SHOOT  x, y (hh)
+              END    nothing; its tick is the length of the recording
+
+A recording cut short before its END record is still read, up to the
+last complete record.
+'''
+
+import struct
+
+from sim import Simulation
+
+MAGIC = b'BPRP'
+VERSION = 1
+
+EXTENSION = '.rep'
+
+KEYS, MOUSE, SHOOT, END = range(4)
+
+LEFT_KEY = 1
+RIGHT_KEY = 2
+SPACE_KEY = 4
+
+HEADER = struct.Struct('<4sBIdBB')
+RECORD = struct.Struct('<IB')
+POSITION = struct.Struct('<hh')
+
+def key_mask(keys):
+    mask = 0
+    if keys.left:
+        mask |= LEFT_KEY
+    if keys.right:
+        mask |= RIGHT_KEY
+    if keys.space:
+        mask |= SPACE_KEY
+    return mask
+
+class Recorder(object):
+    '''Writes the input of a simulation to "filename" as it runs.
+
+    The simulation must be stepped with a fixed "step" for the recording
+    to replay exactly.
+    '''
+    def __init__(self, simulation, filename, step):
+        self.file = open(filename, 'wb')
+
+        self.file.write(HEADER.pack(MAGIC, VERSION, simulation.seed, step,
+                                    simulation.world_index, len(simulation.worlds)))
+        for world in simulation.worlds:
+            name = world.encode('utf-8')
+            self.file.write(struct.pack('<B', len(name)) + name)
+
+        self.keys = 0
+        self.mouse_position = None
+
+        simulation.recorder = self
+
+    def write(self, tick, kind, payload=b''):
+        self.file.write(RECORD.pack(tick, kind) + payload)
+
+    def step(self, simulation):
+        keys = key_mask(simulation.input)
+        if keys != self.keys:
+            self.keys = keys
+            self.write(simulation.tick, KEYS, struct.pack('<B', keys))
+
+        mouse_position = simulation.input.mouse_position
+        if mouse_position is not None and mouse_position != self.mouse_position:
+            self.mouse_position = mouse_position
+            self.write(simulation.tick, MOUSE, POSITION.pack(*mouse_position))
+
+        # Keep the file on disk complete up to this tick in case the game
+        # never gets to close() it.
+        self.file.flush()
+
+    def shoot(self, simulation, x, y):
+        self.write(simulation.tick, SHOOT, POSITION.pack(x, y))
+
+    def close(self, simulation):
+        self.write(simulation.tick, END)
+        self.file.close()
+
+        simulation.recorder = None
+
+class Replay(object):
+    '''A recording loaded from "filename", ready to play back.
+    '''
+    def __init__(self, filename):
+        contents = open(filename, 'rb').read()
+        if len(contents) < HEADER.size:
+            raise ValueError('%s is not a recording this version can play' % filename)
+
+        magic, version, self.seed, self.step, self.world_index, count = HEADER.unpack_from(contents)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a recording this version can play' % filename)
+
+        offset = HEADER.size
+        self.worlds = []
+        for i in range(count):
+            length = ord(contents[offset:offset + 1])
+            self.worlds.append(contents[offset + 1:offset + 1 + length].decode('utf-8'))
+            offset += 1 + length
+
+        # A game that crashed or was killed never wrote its END record, and
+        # may have stopped part way through another one. Such a recording
+        # plays up to the last record that was written in full.
+        self.records = []
+        self.ticks = None
+        while self.ticks is None and offset + RECORD.size <= len(contents):
+            tick, kind = RECORD.unpack_from(contents, offset)
+            offset += RECORD.size
+
+            if kind == KEYS:
+                if offset + 1 > len(contents):
+                    break
+                self.records.append((tick, kind, ord(contents[offset:offset + 1])))
+                offset += 1
+            elif kind in (MOUSE, SHOOT):
+                if offset + POSITION.size > len(contents):
+                    break
+                self.records.append((tick, kind, POSITION.unpack_from(contents, offset)))
+                offset += POSITION.size
+            else:
+                self.ticks = tick
+
+        if self.ticks is None:
+            self.ticks = self.records[-1][0] if self.records else 0
+
+        self.position = 0
+
+    def simulation(self, view_width=800, view_height=600):
+        '''A new simulation set up the way the recording started.
+        '''
+        simulation = Simulation(list(self.worlds), view_width, view_height, self.seed)
+        simulation.world_index = self.world_index
+        return simulation
+
+    def apply(self, simulation):
+        '''Feed the recorded input for the coming tick into "simulation".
+        '''
+        records = self.records
+        keys = simulation.input
+
+        while self.position < len(records) and records[self.position][0] <= simulation.tick:
+            tick, kind, value = records[self.position]
+            self.position += 1
+
+            if kind == KEYS:
+                keys.left = bool(value & LEFT_KEY)
+                keys.right = bool(value & RIGHT_KEY)
+                keys.space = bool(value & SPACE_KEY)
+            elif kind == MOUSE:
+                keys.mouse_position = value
+            elif kind == SHOOT:
+                simulation.shoot(*value)
+
+    def finished(self, simulation):
+        return simulation.complete or simulation.tick >= self.ticks
+
+def play(replay, simulation=None):
+    '''Play "replay" back as fast as possible and return the simulation.
+    '''
+    if simulation is None:
+        simulation = replay.simulation()
+        simulation.start_level()
+
+    while not replay.finished(simulation):
+        replay.apply(simulation)
+        simulation.step(replay.step)
+        del simulation.events[:]
+
+    return simulation
@@ -0,0 +1,764 @@
+'''The game rules without any windowing, sound or drawing.
+
+A Simulation holds the current level, the player and the goo and steps
+them forward in time. It never touches pyglet, so it runs on machines
+without a display or audio device. Things a renderer has to react to,
+like sounds, are reported as strings in Simulation.events.
+'''
+
+import math
+import random
+
+import data
+import levelfile
+from spatial import SpatialHash
+import streaming
+import tmx
+from tilemap import TileMap, TILE_SIZE, sweep
+from tilemap import LAVA, PRINCESS, LEFT, RIGHT, TOP, BOTTOM
+
+GRAVITY = -300
+
+# Length of the fixed steps the game runs, records and plays back in
+STEP = 1 / 60.0
+
+# Converted from the JSON maps by convert_levels.py
+WORLDS = ['map1.lvl',
+          'map2.lvl',
+          'map3.lvl']
+
+# Moves longer than this in one step are swept along the tile grid, so they
+# cannot pass through a tile. Shorter ones only test where they end up.
+SWEEP_DISTANCE = TILE_SIZE / 2
+
+# Step goo in flight with NumPy, see vectorgoo.py, when it is installed
+VECTOR_GOO = False
+
+# Frame sizes of the sprite sheets, which the physics depends on
+PLAYER_COLUMNS, PLAYER_ROWS = 2, 5
+GOO_FRAMES = 4
+
+frame_sizes = {}
+
+def frame_size(filename, columns, rows):
+    key = (filename, columns, rows)
+    if key not in frame_sizes:
+        width, height = data.image_size(filename)
+        frame_sizes[key] = (width // columns, height // rows)
+
+    return frame_sizes[key]
+
+def interpolate(previous, current, alpha):
+    return previous + (current - previous) * alpha
+
+def world_box(a):
+    '''The hitbox of a body in world coordinates.
+
+    Bodies keep this in their "box" attribute, refreshed when they move.
+    '''
+    x1 = a.xpos - a.anchor_x + a.hitbox[0]
+    y1 = a.ypos - a.anchor_y + a.hitbox[1]
+
+    return (x1, y1, x1 + (a.hitbox[2] - a.hitbox[0]), y1 + (a.hitbox[3] - a.hitbox[1]))
+
+def collide_objects(a, b):
+    a_x1, a_y1, a_x2, a_y2 = a.box
+    b_x1, b_y1, b_x2, b_y2 = b.box
+
+    if a_x1 > b_x2:
+        return False
+
+    if a_x2 < b_x1:
+        return False
+
+    if a_y1 > b_y2:
+        return False
+
+    if a_y2 < b_y1:
+        return False
+
+    return True
+
+def spawn_position(tile):
+    '''Where the player starts on top of spawn "tile", in world coordinates.
+    '''
+    return tile[0] * TILE_SIZE, (tile[1] + 1) * TILE_SIZE
+
+class Level(object):
+    '''A parsed world and everything the simulation works out from it.
+
+    None of this changes while the level is played, so a Simulation keeps
+    one Level per world for the whole session.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+
+        if filename.endswith(streaming.EXTENSION):
+            self.tile_map = streaming.StreamingTileMap(filename)
+            self.world = self.tile_map.world
+        else:
+            if filename.endswith(levelfile.EXTENSION):
+                self.world = levelfile.load(filename)
+            elif filename.endswith(tmx.EXTENSION):
+                self.world = tmx.load(filename)
+            else:
+                self.world = data.load_json(filename)
+
+            self.tile_map = TileMap(self.world['width'], self.world['tiles'])
+
+        spawn = self.world.get('spawn')
+        if spawn is None:
+            spawn = levelfile.spawn_tile(self.world['tiles'], self.world['width'])
+
+        self.spawn = spawn_position(spawn)
+
+class Input(object):
+    '''What the player is pressing, in screen coordinates for the mouse.
+    '''
+    def __init__(self):
+        self.left = False
+        self.right = False
+        self.space = False
+        self.mouse_position = None
+
+class Goo(object):
+    def __init__(self, simulation, slot, x, y, dx, dy):
+        self.simulation = simulation
+        self.slot = slot
+
+        self.frame_width, self.frame_height = frame_size('goo.png', GOO_FRAMES, 1)
+        self.splat_width, self.splat_height = frame_size('splat.png', 1, 1)
+
+        self.animation_speed = 0.25
+
+        self.hitbox = (0, 0, self.splat_width, self.splat_height)
+        self.box = None
+
+        # Bumped whenever the goo changes in a way a renderer must pick up
+        self.revision = 0
+
+        self.reset(x, y, dx, dy)
+
+    def reset(self, x, y, dx, dy):
+        self.xpos = self.previous_xpos = x
+        self.ypos = self.previous_ypos = y
+
+        self.speedx = dx
+        self.speedy = dy
+
+        self.animation_time = 0
+        self.animation_frame = 0
+
+        self.anchor_x = self.frame_width / 2
+        self.anchor_y = self.frame_height / 2
+
+        self.splat = False
+        self.rotation = 0
+        self.visible = True
+
+        self.revision += 1
+
+    def update(self, dt):
+        if not self.visible:
+            return
+
+        if not self.splat:
+            oldx = self.xpos
+            oldy = self.ypos
+
+            self.xpos += self.speedx * dt
+            self.ypos += self.speedy * dt
+
+            # Goo gets half gravity
+            self.speedy += (GRAVITY / 2) * dt
+
+            self.animation_time += dt
+            if self.animation_time >= self.animation_speed:
+                self.animation_frame += int(self.animation_time / self.animation_speed)
+                self.animation_frame %= GOO_FRAMES
+                self.animation_time %= self.animation_speed
+
+            if self.swept_hit(oldx, oldy):
+                return
+
+            x = self.xpos - 1
+            y = self.ypos - 1
+
+            tile_map = self.simulation.tile_map
+
+            collisions = tile_map.collide(x, y, 2, 2)
+            if collisions:
+                self.hit(collisions[0])
+
+    def swept_hit(self, oldx, oldy):
+        '''Hit the first tile on the way from oldx, oldy, if the move was long.
+        '''
+        dx = self.xpos - oldx
+        dy = self.ypos - oldy
+        if dx * dx + dy * dy <= SWEEP_DISTANCE * SWEEP_DISTANCE:
+            return False
+
+        swept = sweep(self.simulation.tile_map, oldx - 1, oldy - 1, 2, 2, dx, dy)
+        if swept is None:
+            return False
+
+        fraction, collision = swept
+        self.xpos = oldx + dx * fraction
+        self.ypos = oldy + dy * fraction
+        self.hit(collision)
+
+        return True
+
+    def hit(self, collision):
+        '''Splat against tile index "collision", or vanish into lava.
+        '''
+        tile_map = self.simulation.tile_map
+
+        self.revision += 1
+
+        if tile_map.flags[collision] & (LAVA | PRINCESS):
+            self.visible = False
+            return
+
+        self.splat = True
+        self.simulation.events.append('splat')
+
+        surrounds = tile_map.surrounds[collision]
+
+        tile_x = (collision % tile_map.width) * TILE_SIZE + (TILE_SIZE / 2)
+        tile_y = (collision / tile_map.width) * TILE_SIZE + (TILE_SIZE / 2)
+
+        if self.speedy < 0 and self.ypos > tile_y and not surrounds & TOP:
+            self.ypos = tile_y + (TILE_SIZE / 2)
+        elif self.speedy > 0 and self.ypos + self.anchor_y < tile_y and not surrounds & BOTTOM:
+            self.ypos = tile_y - (TILE_SIZE / 2)
+            self.rotation = 180
+        elif self.xpos < tile_x and not surrounds & LEFT:
+            self.xpos = tile_x - (TILE_SIZE / 2)
+            self.rotation = -90
+        elif self.xpos > tile_x and not surrounds & RIGHT:
+            self.xpos = tile_x + (TILE_SIZE / 2)
+            self.rotation = 90
+
+        self.anchor_x = self.splat_width / 2
+        self.anchor_y = 0
+        self.box = world_box(self)
+
+class GooPool(object):
+    '''A fixed number of reusable goo for one level.
+
+    Goo in flight and splatted goo are kept apart, and goo that is lost in
+    lava goes back to the free list straight away, so update() only visits
+    goo that is still moving.
+    '''
+    def __init__(self, simulation, capacity):
+        self.simulation = simulation
+        self.capacity = capacity
+
+        self.slots = []
+        self.free = []
+        self.flying = []
+        self.splats = []
+
+        self.splat_hash = SpatialHash(TILE_SIZE * 2)
+        self.nearby_splats = []
+
+        # Goo fired so far, numbering them in firing order
+        self.fired = 0
+
+    def spawn(self, x, y, dx, dy):
+        if self.free:
+            goo = self.free.pop()
+            goo.reset(x, y, dx, dy)
+        elif len(self.slots) < self.capacity:
+            goo = Goo(self.simulation, len(self.slots), x, y, dx, dy)
+            self.slots.append(goo)
+        else:
+            return None
+
+        # Slots lost in lava are reused, so slot order is not firing order
+        goo.sequence = self.fired
+        self.fired += 1
+
+        self.flying.append(goo)
+        return goo
+
+    def update(self, dt):
+        flying = []
+
+        for goo in self.flying:
+            goo.update(dt)
+
+            if not goo.visible:
+                self.free.append(goo)
+            elif goo.splat:
+                self.splats.append(goo)
+                self.splat_hash.insert(goo, goo.box)
+            else:
+                flying.append(goo)
+
+        self.flying = flying
+
+    def reset(self):
+        '''Take back every goo, as if the pool had just been made.
+        '''
+        for goo in self.slots:
+            goo.visible = False
+            goo.revision += 1
+
+        # Hand the slots out again from the first, in the order a new pool
+        # would create them
+        self.free = self.slots[::-1]
+        self.flying = []
+        self.splats = []
+        self.splat_hash.clear()
+
+    def store_previous(self):
+        for goo in self.flying:
+            goo.previous_xpos = goo.xpos
+            goo.previous_ypos = goo.ypos
+
+    def sync(self):
+        '''Bring the Goo objects up to date for drawing; they always are here.
+        '''
+
+    def nearby(self, box):
+        '''Return the splatted goo that might overlap "box", in firing order.
+
+        The returned list is reused by the next call.
+        '''
+        nearby = self.splat_hash.query(box, self.nearby_splats)
+        nearby.sort(key=lambda goo: goo.sequence)
+        return nearby
+
+def make_goo_pool(simulation, capacity):
+    if VECTOR_GOO:
+        import vectorgoo
+        if vectorgoo.numpy is not None:
+            return vectorgoo.VectorGooPool(simulation, capacity)
+
+    return GooPool(simulation, capacity)
+
+class Player(object):
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+        self.width, self.height = frame_size('player.png', PLAYER_COLUMNS, PLAYER_ROWS)
+        self.anchor_x = self.width / 2
+        self.anchor_y = self.height / 2
+
+        self.hitbox = (10, 2, 38, 30)
+
+        self.walk_speed = 100
+        self.walk_damping = 0.1
+        self.walk_frame_speed = 0.25
+
+        self.goo_pool = make_goo_pool(simulation, simulation.world['max_goo'])
+
+        self.shoot_speed = 0.25
+
+        self.bounce_height = 400
+
+        self.reset()
+
+    def reset(self):
+        '''Put the player back at the start of the level with all its goo.
+        '''
+        # Index into the sprite sheet frames, flipped when facing left
+        self.frame = -2
+        self.flip = False
+        self.rotation = 0
+
+        self.box = None
+
+        self.xpos, self.ypos = self.simulation.level.spawn
+
+        self.previous_xpos = self.xpos
+        self.previous_ypos = self.ypos
+
+        self.speedx = self.speedy = 0
+
+        self.walking = False
+        self.walk_frame_time = 0
+
+        self.goo_pool.reset()
+        self.goo_fired = 0
+
+        self.shoot_time = 0
+        self.shooting = False
+
+        self.bounce_first = None
+
+        self.finished = False
+        self.dead = False
+
+    def screen_position(self):
+        offset = self.simulation.world_offset
+        return self.xpos - offset[0], self.ypos - offset[1]
+
+    def store_previous(self):
+        self.previous_xpos = self.xpos
+        self.previous_ypos = self.ypos
+
+        self.goo_pool.store_previous()
+
+    def shoot(self, x, y):
+        if self.dead or self.finished:
+            return
+
+        if self.goo_fired >= self.simulation.world['max_goo']:
+            return
+
+        screen_x, screen_y = self.screen_position()
+        dx = x - screen_x
+        dy = y - screen_y
+
+        if self.goo_pool.spawn(self.xpos, self.ypos, dx, dy) is None:
+            return
+
+        self.simulation.events.append('shoot')
+
+        self.goo_fired += 1
+
+        self.shooting = True
+
+    def sweep(self, x, y, dx, dy):
+        '''How much of a move along one axis to keep, stopping a pixel into the
+        first tile on the way for the collisions to push back out of, or None
+        to keep all of it.
+        '''
+        hitbox = self.hitbox
+        swept = sweep(self.simulation.tile_map, x + hitbox[0], y + hitbox[1],
+                      hitbox[2] - hitbox[0], hitbox[3] - hitbox[1], dx, dy)
+
+        if swept is None:
+            return None
+
+        moved = dx or dy
+        fraction = min(swept[0] + 1 / math.fabs(moved), 1)
+        return moved * fraction
+
+    def update(self, dt):
+        simulation = self.simulation
+        tile_map = simulation.tile_map
+        keys = simulation.input
+
+        if self.dead:
+            self.speedy += GRAVITY * dt
+
+            self.xpos += self.speedx * dt
+            self.ypos += self.speedy * dt
+            self.rotation += 180 * dt
+
+            simulation.update_offset()
+
+            self.goo_pool.update(dt)
+
+            return
+
+        if self.finished:
+            self.rotation += 180 * dt
+
+            return
+
+        if self.walking:
+            if keys.left:
+                self.speedx = -self.walk_speed
+            elif keys.right:
+                self.speedx = self.walk_speed
+            else:
+                if self.speedx > 1:
+                    self.speedx -= self.walk_speed * self.walk_damping
+                elif self.speedx < -1:
+                    self.speedx += self.walk_speed * self.walk_damping
+                else:
+                    self.speedx = 0
+        else:
+            if keys.left:
+                if self.speedx > -self.walk_speed:
+                    self.speedx -= self.walk_speed * 3 * dt
+                    self.speedx = max(self.speedx, -self.walk_speed)
+            elif keys.right:
+                if self.speedx < self.walk_speed:
+                    self.speedx += self.walk_speed * 3 * dt
+                    self.speedx = min(self.speedx, self.walk_speed)
+
+        oldx = self.xpos - self.anchor_x
+        oldy = self.ypos - self.anchor_y
+
+        self.xpos += self.speedx * dt
+
+        if self.xpos < self.anchor_x:
+            self.xpos = self.anchor_x
+            self.speedx = 0
+
+        if self.xpos > TILE_SIZE * tile_map.width - self.anchor_x:
+            self.xpos = TILE_SIZE * tile_map.width - self.anchor_x
+            self.speedx = 0
+
+        # Each axis is swept on its own, so a tile underfoot does not cut
+        # short a walk and a wall does not stop a fall
+        moved = self.xpos - self.anchor_x - oldx
+        if math.fabs(moved) > SWEEP_DISTANCE:
+            kept = self.sweep(oldx, oldy, moved, 0)
+            if kept is not None:
+                self.xpos = oldx + kept + self.anchor_x
+
+        self.speedy += GRAVITY * dt
+        self.ypos += self.speedy * dt
+
+        moved = self.ypos - self.anchor_y - oldy
+        if math.fabs(moved) > SWEEP_DISTANCE:
+            kept = self.sweep(self.xpos - self.anchor_x, oldy, 0, moved)
+            if kept is not None:
+                self.ypos = oldy + kept + self.anchor_y
+
+        x = self.xpos - self.anchor_x
+        y = self.ypos - self.anchor_y
+
+        self.walking = False
+
+        # Find the tile collisions
+        collisions = tile_map.collide(x + self.hitbox[0],
+                                      y + self.hitbox[1],
+                                      self.hitbox[2] - self.hitbox[0],
+                                      self.hitbox[3] - self.hitbox[1])
+
+        if collisions:
+            for collision in collisions:
+                surrounds = tile_map.surrounds[collision]
+                flags = tile_map.flags[collision]
+
+                if flags & PRINCESS:
+                    self.frame = -1
+                    self.finished = True
+
+                    simulation.events.append('finished')
+
+                tile_x = (collision % tile_map.width) * TILE_SIZE + (TILE_SIZE / 2)
+                tile_y = (collision / tile_map.width) * TILE_SIZE + (TILE_SIZE / 2)
+
+                if self.speedy < 0 and oldy > tile_y and not surrounds & TOP:
+                    self.ypos = tile_y + (TILE_SIZE / 2) + self.anchor_y - self.hitbox[1]
+                    self.speedy = 0
+                    self.walking = True
+
+                    if flags & LAVA:
+                        self.speedx = simulation.random.randint(-self.walk_speed, self.walk_speed)
+                        self.speedy = simulation.random.randint(self.walk_speed, self.walk_speed * 2)
+                        self.frame = -1
+                        self.dead = True
+
+                        simulation.events.append('dead')
+
+                elif self.speedy > 0 and oldy + TILE_SIZE < tile_y and not surrounds & BOTTOM:
+                    self.ypos = tile_y - (TILE_SIZE / 2) - self.anchor_y + (self.height - self.hitbox[3])
+                    self.speedy = 0
+
+                elif self.speedx > 0 and oldx + TILE_SIZE < tile_x and not surrounds & LEFT:
+                    self.xpos = tile_x - (TILE_SIZE / 2) - self.anchor_x + self.hitbox[0]
+                    self.speedx = 0
+
+                elif self.speedx < 0 and oldx > tile_x and not surrounds & RIGHT:
+                    self.xpos = tile_x + (TILE_SIZE / 2) + self.anchor_x - (self.width - self.hitbox[2])
+                    self.speedx = 0
+
+        if self.shooting:
+            self.shoot_time += dt
+
+            if self.walking:
+                self.frame = -4
+            else:
+                self.frame = 0
+
+            if self.shoot_time >= self.shoot_speed:
+                self.shoot_time = 0
+                self.shooting = False
+
+                if self.walking:
+                    self.frame = -2
+                else:
+                    self.frame = 2
+
+        elif self.walking:
+            if self.frame not in [-1, -2]:
+                self.frame = -1
+
+            self.walk_frame_time += dt
+            if self.walk_frame_time >= self.walk_frame_speed:
+                if self.frame == -1:
+                    self.frame = -2
+                else:
+                    self.frame = -1
+
+                self.walk_frame_time = 0
+
+        else:
+            self.frame = 2
+
+        if self.walking:
+            self.bounce_first = None
+
+        mouse_position = keys.mouse_position
+        self.flip = bool(mouse_position and mouse_position[0] < self.screen_position()[0])
+
+        simulation.update_offset()
+
+        self.box = world_box(self)
+
+        self.goo_pool.update(dt)
+
+        for goo in self.goo_pool.nearby(self.box):
+            if collide_objects(self, goo):
+                if self.bounce_first is None:
+                    self.bounce_first = goo.rotation
+
+                rotations = [goo.rotation]
+                if math.fabs(goo.rotation - self.bounce_first) != 180:
+                    rotations.append(self.bounce_first)
+
+                for rotation in rotations:
+                    if rotation == 180:
+                        self.speedy = -self.bounce_height
+                    elif rotation == -90:
+                        self.speedx = -self.bounce_height
+                    elif rotation == 90:
+                        self.speedx = self.bounce_height
+                    else:
+                        self.speedy = self.bounce_height
+
+                simulation.events.append('bounce')
+
+class Simulation(object):
+    '''A run through the levels in "worlds".
+
+    "view_width" and "view_height" are the size of the screen the camera
+    follows the player with. Events raised while stepping are appended to
+    "events" and left for the caller to clear.
+
+    All randomness comes from "seed", so the same seed and the same input
+    on every tick always play out the same way.
+    '''
+    def __init__(self, worlds=WORLDS, view_width=800, view_height=600, seed=None):
+        self.worlds = worlds
+        self.view_width = view_width
+        self.view_height = view_height
+
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # Steps taken so far
+        self.tick = 0
+        # Sees the input of every step and shot when set, see replay.py
+        self.recorder = None
+
+        self.input = Input()
+        self.events = []
+
+        self.world_index = 0
+        self.level = None
+        self.world = None
+        self.tile_map = None
+        self.player = None
+
+        # Level for each world index loaded so far
+        self.levels = {}
+
+        self.world_offset = [0, 0]
+        self.previous_offset = [0, 0]
+
+        self.complete = False
+
+    def prepare_level(self, index):
+        '''Return the Level for world "index", loading it the first time.
+
+        Calling this ahead of time, while the current level is finishing,
+        makes the switch to the next one cheap.
+        '''
+        level = self.levels.get(index)
+        if level is None:
+            level = self.levels[index] = Level(self.worlds[index])
+
+        return level
+
+    def start_level(self):
+        self.level = self.prepare_level(self.world_index)
+        self.world = self.level.world
+        self.tile_map = self.level.tile_map
+
+        self.world_offset = [0, 0]
+        self.previous_offset = [0, 0]
+
+        self.player = Player(self)
+
+        self.events.append('level')
+
+    def restart_level(self):
+        '''Play the current level again from the start.
+
+        The level and the player are kept and only their state is reset,
+        which is much cheaper than start_level().
+        '''
+        self.world_offset = [0, 0]
+        self.previous_offset = [0, 0]
+
+        self.player.reset()
+
+        self.events.append('restart')
+
+    def last_level(self):
+        return self.world_index >= len(self.worlds) - 1
+
+    def update_offset(self):
+        player = self.player
+
+        self.world_offset = [player.xpos - (self.view_width / 2), player.ypos - (self.view_height / 2)]
+        self.world_offset[0] = max(0, self.world_offset[0])
+        self.world_offset[1] = max(0, self.world_offset[1])
+
+    def camera(self, alpha):
+        '''The world offset to draw with, "alpha" of the way through a step.
+        '''
+        return (interpolate(self.previous_offset[0], self.world_offset[0], alpha),
+                interpolate(self.previous_offset[1], self.world_offset[1], alpha))
+
+    def shoot(self, x, y):
+        if self.recorder is not None:
+            self.recorder.shoot(self, x, y)
+
+        self.player.shoot(x, y)
+
+    def step(self, dt):
+        if self.complete:
+            return
+
+        if self.recorder is not None:
+            self.recorder.step(self)
+
+        self.tick += 1
+
+        player = self.player
+
+        if player.dead and self.input.space:
+            self.restart_level()
+            return
+
+        if player.finished and self.input.space:
+            self.world_index += 1
+
+            if self.world_index >= len(self.worlds):
+                self.complete = True
+                self.events.append('complete')
+                return
+
+            self.start_level()
+            return
+
+        self.previous_offset = list(self.world_offset)
+        player.store_previous()
+
+        player.update(dt)
+
+        self.tile_map.view(self.world_offset, self.view_width, self.view_height)
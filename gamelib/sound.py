@@ -0,0 +1,97 @@
+'''Sound effects played from a fixed pool of media players.
+
+Calling play() on a source makes a new player every time, so a burst of
+shots and bounces piles up voices. A SoundPool makes its players once,
+lets each effect play at most "limit" times at once, and takes the oldest
+voice when there is no free one.
+'''
+
+import timeit
+
+import pyglet
+
+VOICES = 8
+
+clock = timeit.default_timer
+
+class Effect(object):
+    def __init__(self, source, limit):
+        self.source = source
+        self.limit = limit
+        self.duration = source.duration or 0
+
+        # Voices playing this effect, oldest first
+        self.voices = []
+
+class Voice(object):
+    def __init__(self):
+        self.player = pyglet.media.Player()
+        self.effect = None
+        self.started = 0
+        self.finishes = 0
+
+    def start(self, effect, now):
+        if self.effect is not None:
+            self.effect.voices.remove(self)
+
+        self.effect = effect
+        self.started = now
+        self.finishes = now + effect.duration
+        effect.voices.append(self)
+
+        player = self.player
+        player.pause()
+        # Drop what was playing before queueing the new sound
+        if player.source is not None:
+            player.next()
+        player.queue(effect.source)
+        player.play()
+
+    def release(self):
+        self.effect.voices.remove(self)
+        self.effect = None
+
+class SoundPool(object):
+    def __init__(self, voices=VOICES):
+        self.voices = [Voice() for i in range(voices)]
+        self.effects = {}
+
+        self.plays = 0
+        self.steals = 0
+
+    def add(self, name, source, limit=2):
+        '''Register static "source" as effect "name", playing "limit" at once.
+        '''
+        self.effects[name] = Effect(source, limit)
+
+    def free_finished(self, now):
+        for voice in self.voices:
+            if voice.effect is not None and voice.finishes <= now:
+                voice.release()
+
+    def play(self, name):
+        effect = self.effects[name]
+        now = clock()
+
+        self.free_finished(now)
+
+        if len(effect.voices) >= effect.limit:
+            # The effect is at its limit, restart its oldest voice
+            voice = effect.voices[0]
+            self.steals += 1
+        else:
+            voice = None
+            for candidate in self.voices:
+                if candidate.effect is None:
+                    voice = candidate
+                    break
+
+            if voice is None:
+                voice = min(self.voices, key=lambda candidate: candidate.started)
+                self.steals += 1
+
+        voice.start(effect, now)
+        self.plays += 1
+
+    def playing(self):
+        return sum(len(effect.voices) for effect in self.effects.values())
@@ -0,0 +1,46 @@
+'''Uniform grid broadphase for axis aligned boxes.
+
+Boxes are (x1, y1, x2, y2) tuples in world coordinates.
+'''
+
+class SpatialHash(object):
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.queries = 0
+
+    def cell_range(self, box):
+        size = self.cell_size
+        return (int(box[0] // size), int(box[1] // size),
+                int(box[2] // size), int(box[3] // size))
+
+    def insert(self, item, box):
+        x1, y1, x2, y2 = self.cell_range(box)
+
+        for cell_y in range(y1, y2 + 1):
+            for cell_x in range(x1, x2 + 1):
+                self.cells.setdefault((cell_x, cell_y), []).append(item)
+
+    def query(self, box, results):
+        '''Fill "results" with the items in cells overlapping "box".
+
+        Items are only candidates; their boxes still need testing.
+        '''
+        self.queries += 1
+
+        del results[:]
+
+        x1, y1, x2, y2 = self.cell_range(box)
+
+        for cell_y in range(y1, y2 + 1):
+            for cell_x in range(x1, x2 + 1):
+                cell = self.cells.get((cell_x, cell_y))
+                if cell:
+                    for item in cell:
+                        if item not in results:
+                            results.append(item)
+
+        return results
+
+    def clear(self):
+        self.cells.clear()
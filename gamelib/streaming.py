@@ -0,0 +1,282 @@
+'''Levels stored in chunks and loaded around the camera as they are played.
+
+A streamed level file has the header of a level file (see levelfile.py)
+plus a chunk size, and its tiles grouped by chunk, so the tiles of one
+chunk are a single read out of a memory map. The file is little endian:
+
+    header  "BPLS", version (B), width (H), height (H), max_goo (H),
+            spawn tile x, y (hh), goal tile x, y (hh), chunk size (B),
+            music length (B)
+    music   the music filename, utf-8
+    chunks  chunk size * chunk size tiles (b) for each chunk, row 0 first
+            in both the chunks and their tiles; tiles past the edge of the
+            map are 0
+
+StreamingTileMap answers the same queries as a TileMap, loading chunks
+the first time they are touched. view() drops the chunks that have left a
+margin around the camera, so memory depends on the size of the screen and
+not of the level.
+'''
+
+from array import array
+import mmap
+import struct
+
+import data
+import levelfile
+from tilemap import TILE_SIZE, TILE_LAVA, TILE_PRINCESS
+from tilemap import SOLID, LAVA, PRINCESS, LEFT, RIGHT, TOP, BOTTOM
+
+MAGIC = b'BPLS'
+VERSION = 1
+
+EXTENSION = '.lvs'
+
+CHUNK_SIZE = 16
+
+# Chunks around the view that stay loaded
+MARGIN = 1
+
+HEADER = struct.Struct('<4sBHHHhhhhBB')
+
+def pack(world, chunk_size=CHUNK_SIZE):
+    '''Return the streamed level file contents for a world with all its tiles.
+    '''
+    width = world['width']
+    tiles = array('b', world['tiles'])
+
+    if len(tiles) % width:
+        raise ValueError('%d tiles do not make rows of %d' % (len(tiles), width))
+    height = len(tiles) // width
+
+    music = world['music'].encode('utf-8')
+    spawn_x, spawn_y = levelfile.spawn_tile(tiles, width)
+    goal_x, goal_y = levelfile.goal_tile(tiles, width)
+
+    parts = [HEADER.pack(MAGIC, VERSION, width, height, world['max_goo'],
+                         spawn_x, spawn_y, goal_x, goal_y, chunk_size, len(music)),
+             music]
+
+    for chunk_y in range(0, height, chunk_size):
+        for chunk_x in range(0, width, chunk_size):
+            chunk = array('b', [0]) * (chunk_size * chunk_size)
+
+            for y in range(chunk_y, min(chunk_y + chunk_size, height)):
+                row = tiles[y * width + chunk_x:y * width + min(chunk_x + chunk_size, width)]
+                start = (y - chunk_y) * chunk_size
+                chunk[start:start + len(row)] = row
+
+            parts.append(chunk.tostring())
+
+    return b''.join(parts)
+
+def convert(world, destination, chunk_size=CHUNK_SIZE):
+    '''Write the streamed level file for "world" to path "destination".
+    '''
+    # A cut short file would be mapped and read past its end
+    data.write_atomic(destination, lambda output: output.write(pack(world, chunk_size)))
+
+class Chunk(object):
+    def __init__(self, tiles, flags, surrounds):
+        self.tiles = tiles
+        self.flags = flags
+        self.surrounds = surrounds
+
+class ChunkTable(object):
+    '''Looks up the flags or surrounds of a tile by its index in the map.
+    '''
+    def __init__(self, tile_map, name):
+        self.tile_map = tile_map
+        self.name = name
+
+    def __getitem__(self, index):
+        tile_map = self.tile_map
+        chunk, local = tile_map.locate(index % tile_map.width, index // tile_map.width)
+        return getattr(chunk, self.name)[local]
+
+class StreamingTileMap(object):
+    '''A TileMap over a streamed level file in the data directory.
+
+    Tile indices are the same as in a TileMap of the whole level, so the
+    simulation works the same on both.
+    '''
+    streaming = True
+
+    def __init__(self, filename):
+        self.filename = filename
+
+        self.file = data.load(filename)
+        self.contents = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, width, height, max_goo, spawn_x, spawn_y,
+         goal_x, goal_y, chunk_size, music_length) = HEADER.unpack_from(self.contents)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a level this version can stream' % filename)
+
+        offset = HEADER.size
+        self.world = {
+            'width': width,
+            'height': height,
+            'max_goo': max_goo,
+            'music': self.contents[offset:offset + music_length].decode('utf-8'),
+            'spawn': (spawn_x, spawn_y),
+            'goal': (goal_x, goal_y),
+        }
+        self.chunks_offset = offset + music_length
+
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.chunks_x = -(-width // chunk_size)
+        self.chunks_y = -(-height // chunk_size)
+
+        # Loaded Chunks by (chunk x, chunk y)
+        self.chunks = {}
+
+        self.flags = ChunkTable(self, 'flags')
+        self.surrounds = ChunkTable(self, 'surrounds')
+
+        self.collisions = []
+        self.queries = 0
+        self.loads = 0
+
+    def chunk_offset(self, chunk_x, chunk_y):
+        size = self.chunk_size
+        return self.chunks_offset + (chunk_y * self.chunks_x + chunk_x) * size * size
+
+    def solid(self, x, y):
+        '''Whether tile x, y is solid, read straight from the file.
+        '''
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return False
+
+        size = self.chunk_size
+        offset = self.chunk_offset(x // size, y // size) + (y % size) * size + x % size
+
+        # A signed byte above 0
+        return 0 < ord(self.contents[offset:offset + 1]) < 128
+
+    def load_chunk(self, chunk_x, chunk_y):
+        size = self.chunk_size
+        offset = self.chunk_offset(chunk_x, chunk_y)
+        tiles = array('b', self.contents[offset:offset + size * size])
+
+        flags = bytearray(size * size)
+        surrounds = bytearray(size * size)
+
+        base_x = chunk_x * size
+        base_y = chunk_y * size
+        width = self.width
+
+        for local in range(size * size):
+            local_x = local % size
+            local_y = local // size
+            x = base_x + local_x
+            y = base_y + local_y
+
+            tile = tiles[local]
+            if tile > 0:
+                flags[local] = SOLID
+                if tile == TILE_LAVA:
+                    flags[local] |= LAVA
+                elif tile == TILE_PRINCESS:
+                    flags[local] |= PRINCESS
+
+            if x >= width or y >= self.height:
+                continue
+
+            # Neighbours inside the chunk come from its tiles, the rest
+            # from the file
+            mask = 0
+            if local_x > 0:
+                if tiles[local - 1] > 0:
+                    mask |= LEFT
+            elif self.solid(x - 1, y):
+                mask |= LEFT
+
+            if local_x < size - 1:
+                if tiles[local + 1] > 0:
+                    mask |= RIGHT
+            elif self.solid(x + 1, y):
+                mask |= RIGHT
+
+            if local_y < size - 1:
+                if tiles[local + size] > 0:
+                    mask |= TOP
+            elif self.solid(x, y + 1):
+                mask |= TOP
+
+            # As in TileMap, the first tile of row 1 has nothing below it
+            if y * width + x > width:
+                if local_y > 0:
+                    if tiles[local - size] > 0:
+                        mask |= BOTTOM
+                elif self.solid(x, y - 1):
+                    mask |= BOTTOM
+
+            surrounds[local] = mask
+
+        self.loads += 1
+        chunk = self.chunks[(chunk_x, chunk_y)] = Chunk(tiles, flags, surrounds)
+        return chunk
+
+    def locate(self, x, y):
+        '''Return the loaded Chunk holding tile x, y and the tile's index in it.
+        '''
+        size = self.chunk_size
+        key = (x // size, y // size)
+
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.load_chunk(*key)
+
+        return chunk, (y % size) * size + x % size
+
+    def tile(self, x, y):
+        chunk, local = self.locate(x, y)
+        return chunk.tiles[local]
+
+    def collide(self, x, y, width, height):
+        '''Return the indices of solid tiles overlapping a rectangle.
+
+        The returned list is reused by the next call.
+        '''
+        self.queries += 1
+
+        collisions = self.collisions
+        del collisions[:]
+
+        world_x1 = max(int(x // TILE_SIZE), 0)
+        world_x2 = min(-int(-(x + width) // TILE_SIZE), self.width)
+        world_y1 = max(int(y // TILE_SIZE), 0)
+        world_y2 = min(-int(-(y + height) // TILE_SIZE), self.height)
+
+        locate = self.locate
+        for tile_y in range(world_y1, world_y2):
+            for tile_x in range(world_x1, world_x2):
+                chunk, local = locate(tile_x, tile_y)
+                if chunk.flags[local]:
+                    collisions.append(tile_y * self.width + tile_x)
+
+        return collisions
+
+    def view(self, offset, view_width, view_height):
+        '''Drop the chunks that are more than MARGIN chunks off the view.
+        '''
+        pixels = self.chunk_size * TILE_SIZE
+
+        x1 = int(offset[0] // pixels) - MARGIN
+        y1 = int(offset[1] // pixels) - MARGIN
+        x2 = int((offset[0] + view_width) // pixels) + MARGIN
+        y2 = int((offset[1] + view_height) // pixels) + MARGIN
+
+        # Checked every call, even when the view has not moved, since
+        # collide() and trace() load chunks wherever goo flies
+        for key in list(self.chunks):
+            if not (x1 <= key[0] <= x2 and y1 <= key[1] <= y2):
+                del self.chunks[key]
+
+    def close(self):
+        self.chunks.clear()
+        self.contents.close()
+        self.file.close()
@@ -0,0 +1,215 @@
+'''Level grids with collision data precomputed per tile.
+
+Tiles are stored as a packed array of signed bytes. The collision flags
+and the mask of solid neighbours are worked out once when the level is
+loaded, so collision queries are plain table lookups. NumPy is used to
+build the tables when it is available.
+'''
+
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TILE_SIZE = 48
+
+TILE_PLAYER = -1
+TILE_PRINCESS = 3
+TILE_LAVA = 2
+
+# Collision flags
+SOLID = 1
+LAVA = 2
+PRINCESS = 4
+
+# Neighbour mask bits, set when that neighbour is solid
+LEFT = 1
+RIGHT = 2
+TOP = 4
+BOTTOM = 8
+
+# Keeps the far edges of a swept box off the tile beyond them, as collide()
+# does
+EDGE = 1e-6
+
+def trace(tile_map, x1, y1, x2, y2):
+    '''Find the first solid tile a point moving from x1, y1 to x2, y2 enters.
+
+    Returns (fraction of the move, tile index) or None. The tile the point
+    starts in is not counted. Works on any map with the TileMap interface.
+    '''
+    dx = float(x2 - x1)
+    dy = float(y2 - y1)
+
+    tile_x = int(x1 // TILE_SIZE)
+    tile_y = int(y1 // TILE_SIZE)
+    end_x = int(x2 // TILE_SIZE)
+    end_y = int(y2 // TILE_SIZE)
+
+    # Fraction of the move at which the next column and row are reached,
+    # and the fraction it takes to cross a whole tile
+    if dx > 0:
+        step_x = 1
+        next_x = ((tile_x + 1) * TILE_SIZE - x1) / dx
+        delta_x = TILE_SIZE / dx
+    elif dx < 0:
+        step_x = -1
+        next_x = (tile_x * TILE_SIZE - x1) / dx
+        delta_x = -TILE_SIZE / dx
+    else:
+        step_x = 0
+        next_x = delta_x = float('inf')
+
+    if dy > 0:
+        step_y = 1
+        next_y = ((tile_y + 1) * TILE_SIZE - y1) / dy
+        delta_y = TILE_SIZE / dy
+    elif dy < 0:
+        step_y = -1
+        next_y = (tile_y * TILE_SIZE - y1) / dy
+        delta_y = -TILE_SIZE / dy
+    else:
+        step_y = 0
+        next_y = delta_y = float('inf')
+
+    width = tile_map.width
+    height = tile_map.height
+    flags = tile_map.flags
+
+    while tile_x != end_x or tile_y != end_y:
+        if next_x < next_y:
+            fraction = next_x
+            tile_x += step_x
+            next_x += delta_x
+        else:
+            fraction = next_y
+            tile_y += step_y
+            next_y += delta_y
+
+        if fraction > 1:
+            break
+
+        if 0 <= tile_x < width and 0 <= tile_y < height:
+            index = tile_y * width + tile_x
+            if flags[index]:
+                return fraction, index
+
+    return None
+
+def sweep(tile_map, x, y, width, height, dx, dy):
+    '''Find the first solid tile a box moving by dx, dy runs into.
+
+    Tiles are at least as large as the box, so the box can only touch one
+    with a corner, and the earliest of its corners to enter a tile is the
+    first hit. Returns (fraction of the move, tile index) or None.
+    '''
+    first = None
+
+    for corner_x, corner_y in ((x, y), (x + width - EDGE, y),
+                               (x, y + height - EDGE), (x + width - EDGE, y + height - EDGE)):
+        hit = trace(tile_map, corner_x, corner_y, corner_x + dx, corner_y + dy)
+        if hit is not None and (first is None or hit[0] < first[0]):
+            first = hit
+
+    return first
+
+class TileMap(object):
+    # The whole level is held at once, see streaming.py for the alternative
+    streaming = False
+
+    def __init__(self, width, tiles):
+        self.width = width
+        self.tiles = array('b', tiles)
+        self.height = len(self.tiles) // width
+
+        if numpy is not None and len(self.tiles) == self.width * self.height:
+            self.flags, self.surrounds = self.build_tables_numpy()
+        else:
+            self.flags, self.surrounds = self.build_tables()
+
+        # Reused by every collide() call
+        self.collisions = []
+        self.queries = 0
+
+    def build_tables(self):
+        tiles = self.tiles
+        width = self.width
+        count = len(tiles)
+
+        flags = bytearray(count)
+        surrounds = bytearray(count)
+
+        for index in range(count):
+            tile = tiles[index]
+            if tile > 0:
+                flags[index] = SOLID
+                if tile == TILE_LAVA:
+                    flags[index] |= LAVA
+                elif tile == TILE_PRINCESS:
+                    flags[index] |= PRINCESS
+
+            mask = 0
+            if index % width > 0 and tiles[index - 1] > 0:
+                mask |= LEFT
+            if index % width < width - 1 and tiles[index + 1] > 0:
+                mask |= RIGHT
+            if index < count - width and tiles[index + width] > 0:
+                mask |= TOP
+            # Row 0 has nothing below it, and neither does the first
+            # tile of row 1, as it always has had
+            if index > width and tiles[index - width] > 0:
+                mask |= BOTTOM
+            surrounds[index] = mask
+
+        return flags, surrounds
+
+    def build_tables_numpy(self):
+        grid = numpy.frombuffer(self.tiles, dtype=numpy.int8)
+        grid = grid.reshape((self.height, self.width))
+
+        solid = (grid > 0).astype(numpy.uint8)
+
+        flags = solid * SOLID
+        flags |= (grid == TILE_LAVA).astype(numpy.uint8) * LAVA
+        flags |= (grid == TILE_PRINCESS).astype(numpy.uint8) * PRINCESS
+
+        surrounds = numpy.zeros(grid.shape, dtype=numpy.uint8)
+        surrounds[:, 1:] |= solid[:, :-1] * LEFT
+        surrounds[:, :-1] |= solid[:, 1:] * RIGHT
+        surrounds[:-1, :] |= solid[1:, :] * TOP
+        surrounds[1:, :] |= solid[:-1, :] * BOTTOM
+        if self.height > 1:
+            surrounds[1, 0] &= ~BOTTOM & 0xff
+
+        return bytearray(flags.data), bytearray(surrounds.data)
+
+    def tile(self, x, y):
+        return self.tiles[y * self.width + x]
+
+    def view(self, offset, view_width, view_height):
+        '''Called with the camera after every step; the whole map stays loaded.
+        '''
+
+    def collide(self, x, y, width, height):
+        '''Return the indices of solid tiles overlapping a rectangle.
+
+        The returned list is reused by the next call.
+        '''
+        self.queries += 1
+
+        collisions = self.collisions
+        del collisions[:]
+
+        world_x1 = max(int(x // TILE_SIZE), 0)
+        world_x2 = min(-int(-(x + width) // TILE_SIZE), self.width)
+        world_y1 = max(int(y // TILE_SIZE), 0)
+        world_y2 = min(-int(-(y + height) // TILE_SIZE), self.height)
+
+        flags = self.flags
+        for y_index in range(world_y1 * self.width, world_y2 * self.width, self.width):
+            for index in range(y_index + world_x1, y_index + world_x2):
+                if flags[index]:
+                    collisions.append(index)
+
+        return collisions
@@ -0,0 +1,211 @@
+'''Import of levels drawn in the Tiled map editor.
+
+The TMX file is parsed incrementally, so the XML for a large map is never
+held in memory all at once. Tiles are mapped to the game's tile ids by the
+image of the tileset they come from, and rows are flipped, since TMX rows
+run top down and the game's run bottom up.
+
+Layer data can be XML <tile> elements, CSV or base64, optionally zlib or
+gzip compressed. Where there are several layers, tiles of later layers
+cover those of earlier ones.
+
+The converted level is written next to the TMX file as a level file (see
+levelfile.py) and loaded from there until the TMX file changes.
+'''
+
+from array import array
+import base64
+import gzip
+import os
+import struct
+import zlib
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+import data
+import levelfile
+from tilemap import TILE_PLAYER, TILE_PRINCESS
+
+EXTENSION = '.tmx'
+
+# Game tile id for each tileset image
+TILESET_TILES = {
+    'tile1.png': 1,
+    'tile2.png': 2,
+    'princess.png': TILE_PRINCESS,
+    'player.png': TILE_PLAYER,
+}
+
+# Used when the map has no property for them
+DEFAULT_MAX_GOO = 15
+DEFAULT_MUSIC = 'music1.mp3'
+
+# Tiled keeps flip flags in the top bits of a gid
+GID_MASK = 0x1fffffff
+
+class Tilesets(object):
+    '''Maps Tiled gids to game tile ids.
+    '''
+    def __init__(self):
+        # (firstgid, tile id) in firstgid order
+        self.ranges = []
+        # Tile id of each gid looked up so far
+        self.tiles = {0: 0}
+
+    def add(self, firstgid, image):
+        tile = TILESET_TILES.get(os.path.basename(image), 0)
+        self.ranges.append((firstgid, tile))
+        self.ranges.sort()
+
+        self.tiles = {0: 0}
+
+    def tile(self, gid):
+        gid &= GID_MASK
+
+        tile = self.tiles.get(gid)
+        if tile is None:
+            tile = 0
+            for firstgid, tileset_tile in self.ranges:
+                if firstgid > gid:
+                    break
+                tile = tileset_tile
+            self.tiles[gid] = tile
+
+        return tile
+
+def tileset_image(element, filename):
+    '''The image source of a <tileset>, reading an external .tsx if needed.
+    '''
+    source = element.get('source')
+    if source is not None:
+        path = os.path.join(os.path.dirname(filename), source)
+        element = ElementTree.parse(path).getroot()
+
+    image = element.find('image')
+    if image is None:
+        return ''
+    return image.get('source', '')
+
+def decode_data(element):
+    '''Return the gids held in a <data> element, in TMX order.
+    '''
+    encoding = element.get('encoding')
+    text = element.text or ''
+
+    if encoding == 'csv':
+        return [int(gid) for gid in text.replace('\n', '').split(',') if gid.strip()]
+
+    if encoding == 'base64':
+        raw = base64.b64decode(text.strip())
+
+        compression = element.get('compression')
+        if compression == 'zlib':
+            raw = zlib.decompress(raw)
+        elif compression == 'gzip':
+            raw = gzip.GzipFile(fileobj=BytesIO(raw)).read()
+        elif compression:
+            raise ValueError('unsupported layer compression: %s' % compression)
+
+        return struct.unpack('<%dI' % (len(raw) // 4), raw)
+
+    raise ValueError('unsupported layer encoding: %s' % encoding)
+
+def parse(filename):
+    '''Return a world dict, as levelfile.unpack() does, from TMX path "filename".
+    '''
+    tilesets = Tilesets()
+    properties = {}
+
+    width = height = None
+    tiles = None
+
+    # Tags of the elements the parser is inside
+    path = []
+    layer_data = None
+    gids = []
+
+    for event, element in ElementTree.iterparse(filename, ('start', 'end')):
+        tag = element.tag
+
+        if event == 'start':
+            path.append(tag)
+
+            if tag == 'map':
+                width = int(element.get('width'))
+                height = int(element.get('height'))
+                tiles = array('b', [0]) * (width * height)
+            elif tag == 'data':
+                layer_data = element
+                gids = []
+            continue
+
+        path.pop()
+
+        if tag == 'tile' and layer_data is not None:
+            gids.append(int(element.get('gid', 0)))
+            # Drop the tile elements as they are read
+            del layer_data[:]
+
+        elif tag == 'tileset':
+            tilesets.add(int(element.get('firstgid')), tileset_image(element, filename))
+            element.clear()
+
+        elif tag == 'property' and path == ['map', 'properties']:
+            properties[element.get('name')] = element.get('value')
+
+        elif tag == 'data':
+            if element.get('encoding'):
+                gids = decode_data(element)
+
+            # TMX rows run top down, the game's bottom up
+            for index, gid in enumerate(gids):
+                if gid:
+                    row = height - 1 - index // width
+                    tiles[row * width + index % width] = tilesets.tile(gid)
+
+            element.clear()
+            layer_data = None
+            gids = []
+
+    return {
+        'width': width,
+        'height': height,
+        'max_goo': int(properties.get('max_goo', DEFAULT_MAX_GOO)),
+        'music': properties.get('music', DEFAULT_MUSIC),
+        'spawn': levelfile.spawn_tile(tiles, width),
+        'goal': levelfile.goal_tile(tiles, width),
+        'tiles': tiles,
+    }
+
+def cache_filename(filename):
+    return filename + levelfile.EXTENSION
+
+def load(filename, acquire=False):
+    '''Load a TMX map from the data directory through the data cache.
+
+    The converted level file is used instead while it is newer than the
+    map, and rewritten when it is not.
+    '''
+    def loader():
+        path = data.filepath(filename)
+        cached = data.filepath(cache_filename(filename))
+
+        if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+            world = levelfile.read(cache_filename(filename))
+        else:
+            world = parse(path)
+            try:
+                levelfile.write(cached, world)
+            except (IOError, OSError):
+                # A read only install converts the map every time
+                pass
+
+        return world, len(world['tiles']) + 256
+
+    return data.cache.get(('tmx', filename), loader, acquire)
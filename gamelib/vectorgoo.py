@@ -0,0 +1,198 @@
+'''Goo in flight stepped all at once with NumPy.
+
+VectorGooPool keeps the position, speed and animation of every goo slot
+in arrays and moves all the goo in flight with a few array operations per
+step. Tile hits are found by indexing the level's collision flags with
+the tiles under every goo at once; only goo that hit something is handed
+back to Goo.hit() to splat.
+
+The Goo objects are only brought up to date by sync(), which the renderer
+calls before drawing, and for goo that hits a tile. The results are the
+same as GooPool's, step for step.
+'''
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sim import GooPool, GRAVITY, GOO_FRAMES, SWEEP_DISTANCE
+from tilemap import TILE_SIZE
+
+class VectorGooPool(GooPool):
+    def __init__(self, simulation, capacity):
+        GooPool.__init__(self, simulation, capacity)
+
+        self.xpos = numpy.zeros(capacity)
+        self.ypos = numpy.zeros(capacity)
+        self.previous_xpos = numpy.zeros(capacity)
+        self.previous_ypos = numpy.zeros(capacity)
+        self.speedx = numpy.zeros(capacity)
+        self.speedy = numpy.zeros(capacity)
+        self.animation_time = numpy.zeros(capacity)
+        self.animation_frame = numpy.zeros(capacity, dtype=numpy.int64)
+        self.animation_speed = 0.25
+
+        # Slots of the goo in self.flying, in the same order
+        self.flying_slots = numpy.zeros(0, dtype=numpy.int64)
+
+        # The flags of the tile map last stepped against, as an array
+        self.tile_map = None
+        self.flags = None
+
+    def load(self, goo):
+        slot = goo.slot
+        self.xpos[slot] = goo.xpos
+        self.ypos[slot] = goo.ypos
+        self.previous_xpos[slot] = goo.previous_xpos
+        self.previous_ypos[slot] = goo.previous_ypos
+        self.speedx[slot] = goo.speedx
+        self.speedy[slot] = goo.speedy
+        self.animation_time[slot] = goo.animation_time
+        self.animation_frame[slot] = goo.animation_frame
+
+        self.animation_speed = goo.animation_speed
+
+    def save(self, goo):
+        slot = goo.slot
+        goo.xpos = float(self.xpos[slot])
+        goo.ypos = float(self.ypos[slot])
+        goo.previous_xpos = float(self.previous_xpos[slot])
+        goo.previous_ypos = float(self.previous_ypos[slot])
+        goo.speedx = float(self.speedx[slot])
+        goo.speedy = float(self.speedy[slot])
+        goo.animation_time = float(self.animation_time[slot])
+        goo.animation_frame = int(self.animation_frame[slot])
+
+    def sync(self):
+        '''Copy the arrays back into the Goo objects in flight.
+        '''
+        for goo in self.flying:
+            self.save(goo)
+
+    def spawn(self, x, y, dx, dy):
+        goo = GooPool.spawn(self, x, y, dx, dy)
+        if goo is not None:
+            self.load(goo)
+            self.flying_slots = numpy.append(self.flying_slots, goo.slot)
+
+        return goo
+
+    def reset(self):
+        # Leave the goo as GooPool would have
+        self.sync()
+        GooPool.reset(self)
+        self.flying_slots = numpy.zeros(0, dtype=numpy.int64)
+
+    def store_previous(self):
+        slots = self.flying_slots
+        self.previous_xpos[slots] = self.xpos[slots]
+        self.previous_ypos[slots] = self.ypos[slots]
+
+    def tile_flags(self, tile_map):
+        if tile_map is not self.tile_map:
+            self.tile_map = tile_map
+            self.flags = numpy.frombuffer(tile_map.flags, dtype=numpy.uint8)
+
+        return self.flags
+
+    def first_hits(self, tile_map, slots):
+        '''The first solid tile index under each goo, or -1, as collide() finds it.
+        '''
+        width = tile_map.width
+        flags = self.tile_flags(tile_map)
+
+        # The 2x2 box collide() is asked about covers at most 2x2 tiles
+        x = self.xpos[slots] - 1
+        y = self.ypos[slots] - 1
+
+        x1 = numpy.maximum(numpy.floor_divide(x, TILE_SIZE), 0).astype(numpy.int64)
+        x2 = numpy.minimum(-numpy.floor_divide(-(x + 2), TILE_SIZE), width).astype(numpy.int64)
+        y1 = numpy.maximum(numpy.floor_divide(y, TILE_SIZE), 0).astype(numpy.int64)
+        y2 = numpy.minimum(-numpy.floor_divide(-(y + 2), TILE_SIZE), tile_map.height).astype(numpy.int64)
+
+        hits = numpy.empty(len(slots), dtype=numpy.int64)
+        hits.fill(-1)
+
+        # Last candidate first, so the first in collide() order wins
+        for tile_dy, tile_dx in ((1, 1), (1, 0), (0, 1), (0, 0)):
+            tile_x = x1 + tile_dx
+            tile_y = y1 + tile_dy
+
+            inside = (tile_x < x2) & (tile_y < y2)
+            index = numpy.where(inside, tile_y * width + tile_x, 0)
+
+            solid = inside & (flags[index] != 0)
+            hits = numpy.where(solid, index, hits)
+
+        tile_map.queries += len(slots)
+
+        return hits
+
+    def update(self, dt):
+        tile_map = self.simulation.tile_map
+
+        if tile_map.streaming:
+            # Streamed maps have no flat flag table to index
+            self.sync()
+            GooPool.update(self, dt)
+            self.flying_slots = numpy.array([goo.slot for goo in self.flying], dtype=numpy.int64)
+            for goo in self.flying:
+                self.load(goo)
+            return
+
+        slots = self.flying_slots
+        if not len(slots):
+            return
+
+        oldx = self.xpos[slots]
+        oldy = self.ypos[slots]
+
+        self.xpos[slots] += self.speedx[slots] * dt
+        self.ypos[slots] += self.speedy[slots] * dt
+
+        # Long moves are swept by Goo.swept_hit(), one goo at a time
+        dx = self.xpos[slots] - oldx
+        dy = self.ypos[slots] - oldy
+        fast = dx * dx + dy * dy > SWEEP_DISTANCE * SWEEP_DISTANCE
+
+        # Goo gets half gravity
+        self.speedy[slots] += (GRAVITY / 2) * dt
+
+        speed = self.animation_speed
+        times = self.animation_time[slots] + dt
+        frames = self.animation_frame[slots]
+
+        due = times >= speed
+        frames[due] = (frames[due] + (times[due] / speed).astype(numpy.int64)) % GOO_FRAMES
+        times[due] %= speed
+
+        self.animation_time[slots] = times
+        self.animation_frame[slots] = frames
+
+        hits = self.first_hits(tile_map, slots)
+
+        hit = numpy.nonzero((hits >= 0) | fast)[0]
+        if not len(hit):
+            return
+
+        for i in hit:
+            goo = self.flying[i]
+            self.save(goo)
+
+            if fast[i] and goo.swept_hit(float(oldx[i]), float(oldy[i])):
+                hits[i] = 0
+            elif hits[i] >= 0:
+                goo.hit(int(hits[i]))
+            else:
+                continue
+
+            if not goo.visible:
+                self.free.append(goo)
+            else:
+                self.splats.append(goo)
+                self.splat_hash.insert(goo, goo.box)
+
+        keep = hits < 0
+        self.flying = [flying for flying, kept in zip(self.flying, keep) if kept]
+        self.flying_slots = slots[keep]
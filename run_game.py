@@ -1,4 +1,17 @@
 #! /usr/bin/env python
 
+import sys
+
+from gamelib import options
+from gamelib import sim
+
+opts, args = options.parse(sys.argv[1:])
+
+sim.VECTOR_GOO = opts.vector_goo
+
+if options.headless(opts):
+    from gamelib import headless
+    sys.exit(headless.main(opts, args))
+
 from gamelib import main
-main.main()
+main.main(opts)
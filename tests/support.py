@@ -0,0 +1,51 @@
+'''Shared setup for the tests.
+
+The game modules import each other by their plain names, so gamelib is
+put on the path, as it is when the game runs.
+'''
+
+import os
+import sys
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+gamelib = os.path.join(root, 'gamelib')
+
+if gamelib not in sys.path:
+    sys.path.insert(0, gamelib)
+
+import bench
+import sim
+
+STEP = sim.STEP
+
+def data_path(filename):
+    return os.path.join(root, 'data', filename)
+
+def play(simulation, ticks, drive=bench.scripted_input, step=STEP):
+    '''Step "simulation" "ticks" times with input from drive(), starting
+    its level first if it has not been.
+
+    Returns the events seen, in order.
+    '''
+    events = []
+
+    if simulation.player is None:
+        simulation.start_level()
+        events.extend(simulation.events)
+        del simulation.events[:]
+    for i in range(ticks):
+        drive(simulation)
+        simulation.step(step)
+        events.extend(simulation.events)
+        del simulation.events[:]
+
+    return events
+
+def state(simulation):
+    '''Everything about a simulation that should come out the same twice.
+    '''
+    player = simulation.player
+    return (simulation.tick, simulation.world_index, player.xpos, player.ypos,
+            player.speedx, player.speedy, player.dead, player.finished,
+            [(goo.xpos, goo.ypos, goo.splat, goo.visible, goo.rotation)
+             for goo in player.goo_pool.slots])
@@ -0,0 +1,83 @@
+import unittest
+
+import support
+import data
+
+def loader(value, size):
+    def load():
+        loads.append(value)
+        return value, size
+    return load
+
+loads = []
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        del loads[:]
+        self.cache = data.Cache(budget=100)
+
+    def test_hit_does_not_load_again(self):
+        first = self.cache.get('a', loader(['a'], 10))
+        second = self.cache.get('a', loader(['other'], 10))
+
+        self.assertTrue(first is second)
+        self.assertEqual(loads, [['a']])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_least_recently_used_goes_first(self):
+        self.cache.get('a', loader('a', 40))
+        self.cache.get('b', loader('b', 40))
+        self.cache.get('a', loader('a', 40))
+        self.cache.get('c', loader('c', 40))
+
+        self.assertEqual(sorted(self.cache.entries), ['a', 'c'])
+        self.assertEqual(self.cache.size, 80)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_stays_within_budget(self):
+        for i in range(10):
+            self.cache.get(i, loader(str(i), 30))
+
+        self.assertTrue(self.cache.size <= self.cache.budget)
+        self.assertEqual(sorted(self.cache.entries), [7, 8, 9])
+
+    def test_acquired_entries_are_kept_until_released(self):
+        pinned = self.cache.get('a', loader(['a'], 60), acquire=True)
+        self.cache.get('b', loader(['b'], 60))
+
+        # Over budget, but "a" is referenced and "b" was only just loaded
+        self.assertEqual(sorted(self.cache.entries), ['a', 'b'])
+
+        self.cache.get('c', loader(['c'], 50))
+        self.assertEqual(sorted(self.cache.entries), ['a', 'c'])
+
+        self.cache.release(pinned)
+        self.assertEqual(sorted(self.cache.entries), ['c'])
+
+    def test_release_counts_references(self):
+        pinned = self.cache.get('a', loader(['a'], 60), acquire=True)
+        self.cache.get('a', loader(['a'], 60), acquire=True)
+
+        self.cache.release(pinned)
+        self.cache.get('b', loader(['b'], 60))
+        self.assertTrue('a' in self.cache.entries)
+
+        self.cache.release(pinned)
+        self.assertFalse('a' in self.cache.entries)
+
+    def test_entries_without_size_are_not_evicted(self):
+        self.cache.get('json', loader({}, 0))
+        self.cache.get('a', loader('a', 80))
+        self.cache.get('b', loader('b', 80))
+
+        self.assertEqual(sorted(self.cache.entries), ['b', 'json'])
+
+    def test_clear(self):
+        self.cache.get('a', loader('a', 10), acquire=True)
+        self.cache.clear()
+
+        self.assertEqual(self.cache.entries, {})
+        self.assertEqual(self.cache.size, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,251 @@
+import base64
+import gzip
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+import support
+import levelfile
+import streaming
+from tilemap import TileMap, TILE_SIZE
+import tmx
+
+MAPS = ['map1', 'map2', 'map3']
+
+def load_json(name):
+    return json.load(open(support.data_path(name + '.json')))
+
+class GridTestCase(unittest.TestCase):
+    def assertSameGrid(self, world, source):
+        self.assertEqual(world['width'], source['width'])
+        self.assertEqual(world['height'], len(source['tiles']) // source['width'])
+        self.assertEqual(list(world['tiles']), source['tiles'])
+        self.assertEqual(world['spawn'], levelfile.spawn_tile(source['tiles'], source['width']))
+        self.assertEqual(world['goal'], levelfile.goal_tile(source['tiles'], source['width']))
+
+class LevelFileTest(GridTestCase):
+    def test_level_files_match_the_json_maps(self):
+        for name in MAPS:
+            source = load_json(name)
+            world = levelfile.read(name + levelfile.EXTENSION)
+
+            self.assertSameGrid(world, source)
+            self.assertEqual(world['max_goo'], source['max_goo'])
+            self.assertEqual(world['music'], source['music'])
+
+    def test_pack_and_unpack(self):
+        source = load_json('map2')
+        world = levelfile.unpack(levelfile.pack(source))
+        self.assertSameGrid(world, source)
+
+    def test_unpack_rejects_other_files(self):
+        self.assertRaises(ValueError, levelfile.unpack, b'XXXX' + b'\0' * 32)
+
+    def test_failed_write_keeps_the_old_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            destination = os.path.join(directory, 'map2' + levelfile.EXTENSION)
+            levelfile.write(destination, load_json('map2'))
+            before = open(destination, 'rb').read()
+
+            broken = dict(load_json('map1'), tiles=[1, 1, 1])
+            self.assertRaises(ValueError, levelfile.write, destination, broken)
+
+            self.assertEqual(open(destination, 'rb').read(), before)
+            self.assertEqual(os.listdir(directory), [os.path.basename(destination)])
+        finally:
+            shutil.rmtree(directory)
+
+# Tilesets as Tiled lays them out, with the gid each game tile is drawn with
+TILESETS = [(1, 'player.png'), (11, 'princess.png'), (13, 'tile1.png'), (14, 'tile2.png')]
+GIDS = {0: 0, -1: 3, 3: 11, 1: 13, 2: 14}
+
+# Tiled's horizontal and vertical flip flags
+FLIPPED = 0x80000000 | 0x40000000
+
+def tmx_gids(source):
+    '''The gids of a JSON map in TMX order, top row first, some flipped.
+    '''
+    width = source['width']
+    tiles = source['tiles']
+
+    gids = []
+    for row in range(len(tiles) // width - 1, -1, -1):
+        for x in range(width):
+            gid = GIDS[tiles[row * width + x]]
+            if gid and x % 3 == 0:
+                gid |= FLIPPED
+            gids.append(gid)
+    return gids
+
+def tmx_data(gids, encoding, compression):
+    if encoding is None:
+        return '<data>%s</data>' % ''.join('<tile gid="%d"/>' % gid for gid in gids)
+
+    if encoding == 'csv':
+        return '<data encoding="csv">\n%s\n</data>' % ','.join(str(gid) for gid in gids)
+
+    raw = struct.pack('<%dI' % len(gids), *gids)
+    if compression == 'zlib':
+        raw = zlib.compress(raw)
+    elif compression == 'gzip':
+        output = BytesIO()
+        archive = gzip.GzipFile(fileobj=output, mode='wb')
+        archive.write(raw)
+        archive.close()
+        raw = output.getvalue()
+
+    attributes = 'encoding="base64"'
+    if compression:
+        attributes += ' compression="%s"' % compression
+    return '<data %s>%s</data>' % (attributes, base64.b64encode(raw).decode('ascii'))
+
+def tmx_map(source, encoding=None, compression=None):
+    width = source['width']
+    height = len(source['tiles']) // width
+
+    tilesets = ''.join(
+        '<tileset firstgid="%d" name="%s" tilewidth="48" tileheight="48">'
+        '<image source="%s"/></tileset>' % (firstgid, image, image)
+        for firstgid, image in TILESETS)
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<map version="1.0" orientation="orthogonal" width="%d" height="%d" '
+            'tilewidth="48" tileheight="48">'
+            '<properties><property name="max_goo" value="%d"/>'
+            '<property name="music" value="%s"/></properties>'
+            '%s<layer name="tiles" width="%d" height="%d">%s</layer></map>' % (
+                width, height, source['max_goo'], source['music'], tilesets,
+                width, height, tmx_data(tmx_gids(source), encoding, compression)))
+
+class TmxTest(GridTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse(self, contents):
+        filename = os.path.join(self.directory, 'map' + tmx.EXTENSION)
+        output = open(filename, 'w')
+        output.write(contents)
+        output.close()
+        return tmx.parse(filename)
+
+    def assertSameMap(self, world, source):
+        self.assertSameGrid(world, source)
+        self.assertEqual(world['max_goo'], source['max_goo'])
+        self.assertEqual(world['music'], source['music'])
+
+    def test_every_layer_encoding_matches_the_json_map(self):
+        source = load_json('map1')
+        for encoding, compression in ((None, None), ('csv', None), ('base64', None),
+                                      ('base64', 'zlib'), ('base64', 'gzip')):
+            world = self.parse(tmx_map(source, encoding, compression))
+            self.assertSameMap(world, source)
+
+    def test_larger_maps_match(self):
+        for name in MAPS[1:]:
+            source = load_json(name)
+            self.assertSameMap(self.parse(tmx_map(source, 'csv')), source)
+
+    def test_gids_map_to_tiles_by_tileset(self):
+        tilesets = tmx.Tilesets()
+        for firstgid, image in TILESETS:
+            tilesets.add(firstgid, 'images/' + image)
+
+        self.assertEqual(tilesets.tile(0), 0)
+        self.assertEqual(tilesets.tile(1), -1)
+        self.assertEqual(tilesets.tile(10), -1)
+        self.assertEqual(tilesets.tile(12), 3)
+        self.assertEqual(tilesets.tile(14 | FLIPPED), 2)
+
+    def test_unknown_compression_is_refused(self):
+        contents = tmx_map(load_json('map1'), 'base64', 'zlib').replace('"zlib"', '"zstd"')
+        self.assertRaises(ValueError, self.parse, contents)
+
+class StreamingTest(GridTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def stream(self, source, chunk_size):
+        # An absolute path is used as it is by data.load()
+        filename = os.path.join(self.directory, 'map' + streaming.EXTENSION)
+        streaming.convert(source, filename, chunk_size)
+        return streaming.StreamingTileMap(filename)
+
+    def test_streamed_levels_match_the_json_maps(self):
+        for name in MAPS:
+            source = load_json(name)
+            # Chunks that do not divide the map, to cover the edges
+            tile_map = self.stream(source, 5)
+            whole = TileMap(source['width'], source['tiles'])
+
+            world = dict(tile_map.world)
+            world['tiles'] = [tile_map.tile(index % tile_map.width, index // tile_map.width)
+                              for index in range(len(source['tiles']))]
+            self.assertSameGrid(world, source)
+            self.assertEqual(world['max_goo'], source['max_goo'])
+            self.assertEqual(world['music'], source['music'])
+
+            for index in range(len(source['tiles'])):
+                self.assertEqual(tile_map.flags[index], whole.flags[index])
+                self.assertEqual(tile_map.surrounds[index], whole.surrounds[index])
+
+            tile_map.close()
+
+    def test_collide_matches_a_whole_map(self):
+        source = load_json('map2')
+        tile_map = self.stream(source, 4)
+        whole = TileMap(source['width'], source['tiles'])
+
+        for y in range(-30, whole.height * TILE_SIZE, 37):
+            for x in range(-30, whole.width * TILE_SIZE, 41):
+                self.assertEqual(list(tile_map.collide(x, y, 28, 28)),
+                                 list(whole.collide(x, y, 28, 28)))
+
+        tile_map.close()
+
+    def test_view_drops_chunks_off_screen(self):
+        tile_map = self.stream(load_json('map2'), 4)
+
+        for y in range(tile_map.height):
+            for x in range(tile_map.width):
+                tile_map.tile(x, y)
+        loaded = len(tile_map.chunks)
+
+        tile_map.view((0, 0), 200, 200)
+        self.assertTrue(0 < len(tile_map.chunks) < loaded)
+        for chunk_x, chunk_y in tile_map.chunks:
+            self.assertTrue(chunk_x <= 2 and chunk_y <= 2)
+
+        tile_map.close()
+
+    def test_view_drops_chunks_loaded_while_it_stays_still(self):
+        tile_map = self.stream(load_json('map2'), 4)
+
+        tile_map.view((0, 0), 200, 200)
+        kept = sorted(tile_map.chunks)
+
+        # Goo flying far off screen loads the chunks it passes through
+        tile_map.collide(80 * TILE_SIZE, 20 * TILE_SIZE, 10, 10)
+        self.assertTrue(len(tile_map.chunks) > len(kept))
+
+        tile_map.view((0, 0), 200, 200)
+        self.assertEqual(sorted(tile_map.chunks), kept)
+
+        tile_map.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+import support  # puts gamelib on the path
+
+try:
+    import main
+except Exception:
+    # No pyglet, or no display to open the game window on
+    main = None
+
+@unittest.skipIf(main is None, 'the game window cannot be opened here')
+class PrefetchTest(unittest.TestCase):
+    def tearDown(self):
+        main.stop_prefetch()
+        main.prefetched.clear()
+
+    def test_prefetch_stopped_in_the_same_tick(self):
+        # The clock calls prefetch_next() from its copy of the schedule
+        # even after stop_prefetch() unscheduled it
+        main.start_prefetch(1)
+        main.stop_prefetch()
+        main.prefetch_next(0)
+
+        self.assertEqual(main.prefetch, None)
+        self.assertEqual(main.prefetched, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+import bench
+import playtest
+import replay
+import sim
+
+class PlaytestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'game' + replay.EXTENSION)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, ticks):
+        simulation = sim.Simulation(['map1.lvl'], seed=0)
+        recorder = replay.Recorder(simulation, self.filename, support.STEP)
+        support.play(simulation, ticks, drive=playtest.walk_right)
+        recorder.close(simulation)
+
+    def test_recording_plays_to_its_end_by_default(self):
+        # Longer than a script plays for
+        self.record(bench.TICKS + 100)
+
+        result = playtest.run((None, self.filename, None))
+        self.assertEqual(result['outcome'], 'timeout')
+        self.assertEqual(result['ticks'], bench.TICKS + 100)
+
+    def test_recording_stops_at_the_given_ticks(self):
+        self.record(300)
+
+        result = playtest.run((None, self.filename, 200))
+        self.assertEqual(result['ticks'], 200)
+
+    def test_script_plays_for_the_default_ticks(self):
+        result = playtest.run(('map1.lvl', 'walk-right', None))
+        self.assertTrue(result['ticks'] <= bench.TICKS)
+
+    def test_every_shipped_level_has_a_completion(self):
+        for world in sim.WORLDS:
+            filename = playtest.completion(world)
+            self.assertNotEqual(filename, None, world)
+
+            result = playtest.run((None, filename, None))
+            self.assertEqual(result['world'], world)
+            self.assertEqual(result['outcome'], 'princess', world)
+
+    def test_level_without_a_completion(self):
+        self.assertEqual(playtest.completion('map_test.lvl'), None)
+
+if __name__ == '__main__':
+    unittest.main()
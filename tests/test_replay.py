@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+import replay
+import sim
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'game' + replay.EXTENSION)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, worlds, ticks):
+        simulation = sim.Simulation(worlds, seed=7)
+        recorder = replay.Recorder(simulation, self.filename, support.STEP)
+        support.play(simulation, ticks)
+        recorder.close(simulation)
+        return simulation
+
+    def test_replay_repeats_the_recorded_game(self):
+        recorded = self.record(['map2.lvl', 'map1.lvl'], 2000)
+
+        recording = replay.Replay(self.filename)
+        self.assertEqual(recording.seed, 7)
+        self.assertEqual(recording.step, support.STEP)
+        self.assertEqual(recording.worlds, ['map2.lvl', 'map1.lvl'])
+        self.assertEqual(recording.ticks, 2000)
+
+        played = replay.play(recording)
+        self.assertEqual(support.state(played), support.state(recorded))
+
+    def test_recording_is_read_back_record_for_record(self):
+        self.record(['map1.lvl'], 300)
+
+        recording = replay.Replay(self.filename)
+        kinds = set(kind for tick, kind, value in recording.records)
+        self.assertTrue(set([replay.KEYS, replay.MOUSE, replay.SHOOT]) <= kinds)
+
+        ticks = [tick for tick, kind, value in recording.records]
+        self.assertEqual(ticks, sorted(ticks))
+
+    def test_recording_cut_short_plays_up_to_where_it_stops(self):
+        self.record(['map1.lvl'], 300)
+        whole = replay.Replay(self.filename)
+
+        contents = open(self.filename, 'rb').read()
+        # Drop the END record and half of the record before it.
+        cut = contents[:-replay.RECORD.size - 3]
+        open(self.filename, 'wb').write(cut)
+
+        recording = replay.Replay(self.filename)
+        self.assertEqual(recording.records, whole.records[:-1])
+        self.assertEqual(recording.ticks, whole.records[-2][0])
+
+        played = replay.play(recording)
+        self.assertTrue(played.tick >= recording.ticks)
+
+    def test_file_shorter_than_a_header_is_rejected(self):
+        self.record(['map1.lvl'], 10)
+        contents = open(self.filename, 'rb').read()
+        open(self.filename, 'wb').write(contents[:replay.HEADER.size - 1])
+
+        self.assertRaises(ValueError, replay.Replay, self.filename)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import support
+import sim
+from tilemap import TILE_SIZE
+
+class SimulationTest(unittest.TestCase):
+    def test_same_seed_and_input_play_the_same(self):
+        first = sim.Simulation(['map2.lvl'], seed=3)
+        second = sim.Simulation(['map2.lvl'], seed=3)
+
+        self.assertEqual(support.play(first, 1200), support.play(second, 1200))
+        self.assertEqual(support.state(first), support.state(second))
+
+    def test_player_lands_on_the_floor(self):
+        simulation = sim.Simulation(['map1.lvl'], seed=0)
+        support.play(simulation, 120, drive=lambda simulation: None)
+
+        player = simulation.player
+        bottom = player.ypos - player.anchor_y + player.hitbox[1]
+        self.assertFalse(player.dead)
+        self.assertEqual(bottom % TILE_SIZE, 0)
+        self.assertEqual(player.speedy, 0)
+
+    def test_goo_splats_on_the_floor(self):
+        simulation = sim.Simulation(['map1.lvl'], seed=0)
+        support.play(simulation, 60, drive=lambda simulation: None)
+
+        def shoot_down(simulation):
+            if simulation.tick == 60:
+                support.bench.shoot_at(simulation, 0, -100)
+
+        events = support.play(simulation, 60, drive=shoot_down)
+
+        self.assertEqual(events.count('shoot'), 1)
+        self.assertEqual(events.count('splat'), 1)
+        goo = simulation.player.goo_pool.splats[0]
+        self.assertEqual(goo.rotation, 0)
+        self.assertEqual(goo.ypos % TILE_SIZE, 0)
+
+    def test_walking_into_lava_kills_and_space_restarts(self):
+        simulation = sim.Simulation(['map3.lvl'], seed=0)
+        events = support.play(simulation, 200, drive=support.bench.wander)
+        self.assertIn('dead', events)
+
+        def restart(simulation):
+            simulation.input.space = True
+
+        events = support.play(simulation, 1, drive=restart)
+        self.assertEqual(events, ['restart'])
+        self.assertFalse(simulation.player.dead)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+import support
+import sim
+import tilemap
+from tilemap import TileMap, TILE_SIZE
+
+# 6 x 3 tiles: a floor, and a wall in column 4
+WORLD = [1, 1, 1, 1, 1, 1,
+         0, 0, 0, 0, 1, 0,
+         0, 0, 0, 0, 1, 0]
+
+# 4 x 3 tiles: a floor, an empty row and a block at the start of the top row
+EDGES = [1, 1, 1, 1,
+         0, 0, 0, 0,
+         1, 0, 0, 1]
+
+class CollideTest(unittest.TestCase):
+    def setUp(self):
+        self.tile_map = TileMap(4, EDGES)
+
+    def test_box_over_the_right_edge_stays_in_its_row(self):
+        # Index 8 is the next row's first tile, not the one past the edge
+        x = 3.5 * TILE_SIZE
+        self.assertEqual(self.tile_map.collide(x, TILE_SIZE, TILE_SIZE, 10), [])
+        self.assertEqual(self.tile_map.collide(x, 2 * TILE_SIZE, TILE_SIZE, 10), [11])
+
+    def test_box_over_the_left_edge_stays_in_its_row(self):
+        # Index 3 is the row below's last tile, not the one past the edge
+        x = -0.5 * TILE_SIZE
+        self.assertEqual(self.tile_map.collide(x, TILE_SIZE, TILE_SIZE, 10), [])
+        self.assertEqual(self.tile_map.collide(x, 2 * TILE_SIZE, TILE_SIZE, 10), [8])
+
+    def test_box_off_the_map_hits_nothing(self):
+        self.assertEqual(self.tile_map.collide(-3 * TILE_SIZE, 0, TILE_SIZE, TILE_SIZE), [])
+        self.assertEqual(self.tile_map.collide(5 * TILE_SIZE, 0, TILE_SIZE, TILE_SIZE), [])
+        self.assertEqual(self.tile_map.collide(0, -3 * TILE_SIZE, TILE_SIZE, TILE_SIZE), [])
+
+class SweepTest(unittest.TestCase):
+    def setUp(self):
+        self.tile_map = TileMap(6, WORLD)
+
+    def test_trace_finds_the_first_tile_entered(self):
+        fraction, index = tilemap.trace(self.tile_map, 10, 60, 280, 60)
+        self.assertEqual(index, 10)
+        self.assertAlmostEqual(fraction, (4 * TILE_SIZE - 10) / 270.0)
+
+    def test_trace_ignores_the_tile_it_starts_in(self):
+        self.assertEqual(tilemap.trace(self.tile_map, 200, 60, 230, 60), None)
+        self.assertEqual(tilemap.trace(self.tile_map, 10, 60, 150, 60), None)
+
+    def test_fast_move_stops_at_the_wall(self):
+        # Far past the wall in one move
+        fraction, index = tilemap.sweep(self.tile_map, 10, 60, 28, 28, 1000, 0)
+        self.assertEqual(index, 10)
+        self.assertAlmostEqual(10 + 28 + 1000 * fraction, 4 * TILE_SIZE, places=4)
+
+    def test_box_resting_on_the_floor_can_slide(self):
+        self.assertEqual(tilemap.sweep(self.tile_map, 10, TILE_SIZE, 28, 28, 100, 0), None)
+
+        fraction, index = tilemap.sweep(self.tile_map, 10, TILE_SIZE, 28, 28, 0, -100)
+        self.assertEqual((fraction, index), (0, 0))
+
+    def test_goo_splats_on_a_wall_at_coarse_steps(self):
+        simulation = sim.Simulation(['map1.lvl'], seed=0)
+        support.play(simulation, 60, drive=lambda simulation: None)
+
+        player = simulation.player
+        goo = player.goo_pool.spawn(10 * TILE_SIZE, 3 * TILE_SIZE, 3000, 0)
+        support.play(simulation, 5, drive=lambda simulation: None, step=0.1)
+
+        # The block at columns 17 to 21, which a single step jumps over
+        self.assertTrue(goo.splat)
+        self.assertEqual(goo.xpos, 17 * TILE_SIZE)
+        self.assertEqual(goo.rotation, -90)
+
+    def test_player_walks_and_lands_at_coarse_steps(self):
+        def walk(simulation):
+            simulation.input.right = True
+
+        distances = []
+        for step, ticks in ((support.STEP, 180), (0.25, 12)):
+            simulation = sim.Simulation(['map1.lvl'], seed=0)
+            simulation.start_level()
+            start = simulation.player.xpos
+            support.play(simulation, ticks, drive=walk, step=step)
+
+            player = simulation.player
+            self.assertEqual(player.ypos - player.anchor_y + player.hitbox[1], 2 * TILE_SIZE)
+            distances.append(player.xpos - start)
+
+        self.assertTrue(abs(distances[0] - distances[1]) < TILE_SIZE / 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import math
+import random
+import unittest
+
+import support
+import sim
+import vectorgoo
+
+def spray(rng):
+    '''Input that walks about and shoots three goo every tick.
+    '''
+    def drive(simulation):
+        keys = simulation.input
+        if simulation.tick % 50 == 0:
+            choice = rng.random()
+            keys.left = choice < 0.3
+            keys.right = choice > 0.6
+        keys.space = simulation.player.dead
+
+        for i in range(3):
+            angle = rng.uniform(0, 2 * math.pi)
+            distance = rng.uniform(50, 400)
+            support.bench.shoot_at(simulation, math.cos(angle) * distance,
+                                   math.sin(angle) * distance)
+    return drive
+
+@unittest.skipIf(vectorgoo.numpy is None, 'NumPy is not installed')
+class VectorGooPoolTest(unittest.TestCase):
+    def tearDown(self):
+        sim.VECTOR_GOO = False
+
+    def play(self, vector, step, ticks):
+        sim.VECTOR_GOO = vector
+
+        simulation = sim.Simulation(['map3.lvl'], seed=5)
+        simulation.start_level()
+        simulation.world = dict(simulation.world, max_goo=100000)
+        simulation.player.goo_pool = sim.make_goo_pool(simulation, 100000)
+
+        events = support.play(simulation, ticks, spray(random.Random(9)), step)
+        simulation.player.goo_pool.sync()
+        return events, support.state(simulation)
+
+    def test_vector_pool_is_used(self):
+        sim.VECTOR_GOO = True
+        simulation = sim.Simulation(['map1.lvl'], seed=0)
+        simulation.start_level()
+        self.assertTrue(isinstance(simulation.player.goo_pool, vectorgoo.VectorGooPool))
+
+    def test_matches_goo_pool(self):
+        self.assertEqual(self.play(True, support.STEP, 1500),
+                         self.play(False, support.STEP, 1500))
+
+    def test_matches_goo_pool_at_coarse_steps(self):
+        # Long moves are swept, see Goo.swept_hit()
+        self.assertEqual(self.play(True, 0.25, 200), self.play(False, 0.25, 200))
+
+if __name__ == '__main__':
+    unittest.main()